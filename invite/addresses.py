@@ -0,0 +1,54 @@
+"""
+addresses
+
+Normalization and deduplication of the mails recipients addresses
+"""
+from email.utils import parseaddr
+
+
+def normalize_email(email):
+    """Normalize an email address to compare it : without surrounding whitespaces, in lower case"""
+    return email.strip().lower()
+
+
+def format_addresses(names_emails):
+    """
+    Format the "name <email>" addresses of (name, email) tuples
+
+    The emails are compared normalized, and each one is only used once, with its first name and
+    as it was written (the local part of an address may be case sensitive) : the guests sharing an
+    email receive one mail.
+
+    :param names_emails: an iterable of (name, email) tuples, the ones without name or email are
+    skipped
+    :return: a generator of the addresses
+    """
+    seen = set()
+    for name, email in names_emails:
+        email = (email or "").strip()
+        name = (name or "").strip()
+        if name and email and normalize_email(email) not in seen:
+            seen.add(normalize_email(email))
+            yield "{} <{}>".format(name, email)
+
+
+def unique_recipients(datatuple, seen=None):
+    """
+    Remove the recipients already sent to from the mass mail tuples, across the whole campaign
+
+    The messages left without recipients are skipped.
+
+    :param datatuple: the iterable of (subject, text, html, from_email, recipients) tuples
+    :param seen: the set of the normalized emails already sent to (updated)
+    :return: a generator of the mass mail tuples
+    """
+    seen = set() if seen is None else seen
+    for subject, text, html, from_email, recipients in datatuple:
+        unique = []
+        for recipient in recipients:
+            email = normalize_email(parseaddr(recipient)[1])
+            if email not in seen:
+                seen.add(email)
+                unique.append(recipient)
+        if unique:
+            yield subject, text, html, from_email, unique
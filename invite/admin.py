@@ -1,16 +1,52 @@
 """
 Admin configurations for django-invite project
 """
+import csv
+
 from django.conf import settings
 from django.contrib import admin, messages
-from django.forms import BooleanField, ModelForm
-from django.urls import reverse
+from django.contrib.admin import helpers
+from django.core.paginator import Paginator
+from django.forms import BooleanField, Form, ModelChoiceField, ModelForm
+from django.forms.models import BaseInlineFormSet
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from django.utils.html import format_html
 from django.utils.translation import gettext as _
 
 from invite.join_and import join_and
-from .models import Family, Guest, Accompany, Event, MailTemplate
-from .send_mass_html_mail import send_mass_html_mail
+from .addresses import unique_recipients
+from .export import Echo, export_rows
+from .hosts import get_host_directory
+from .pagination import KeysetPaginationMixin
+from .purge import purge_events, purge_families
+from .render import activate_languages
+from .records import load_family_records
+from .models import Family, Guest, Accompany, Event, MailTemplate, FamilySearchToken
+from .send_mass_html_mail import run_asend_mass_html_mail, send_mass_html_mail
+from .spool import spool_mass_html_mail
+
+
+def _send_or_spool(datatuple, senders=0, **extra_kwargs):
+    """
+    Send the messages, or write them to the INVITE_SPOOL_DIR spool for the flushspool command
+
+    With the INVITE_ASYNC_SEND setting, the messages are sent by asend_mass_html_mail, over
+    INVITE_SEND_THREADS concurrent sessions.
+
+    :return: the number of sent (or spooled) messages and the text reporting it
+    """
+    spool_dir = getattr(settings, "INVITE_SPOOL_DIR", None)
+    if spool_dir:
+        return spool_mass_html_mail(datatuple, spool_dir, **extra_kwargs), \
+            _("%(result)d messages spooled")
+    if getattr(settings, "INVITE_ASYNC_SEND", False):
+        return run_asend_mass_html_mail(datatuple, sessions=max(senders, 1), **extra_kwargs), \
+            _("%(result)d messages send")
+    return send_mass_html_mail(datatuple, senders=senders, **extra_kwargs), \
+        _("%(result)d messages send")
 
 
 class InviteInline(admin.TabularInline):
@@ -36,14 +72,64 @@ class FamilyInvitationForm(ModelForm):
     send_mail = BooleanField(label=_('Send the mail'), required=False)
 
 
+class InviteFamiliesForm(Form):
+    """Form to choose the event the selected families are invited to"""
+    event = ModelChoiceField(Event.objects.all(), label=_("Event"))
+    send_mail = BooleanField(label=_('Send the mail'), required=False)
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """
+    Inline formset of one page of the related objects
+
+    Only the page forms are rendered, posted and validated, and (as any model formset) only the
+    changed ones are saved.
+    """
+    per_page = 50
+    page_number = None
+    page = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.get_queryset()
+
+    def get_queryset(self):
+        """The related objects of the current page"""
+        if self.page is None:
+            self.page = Paginator(super().get_queryset(), self.per_page).get_page(self.page_number)
+            self._queryset = self.page.object_list
+        return self._queryset
+
+
 class FamilyInvitationInline(admin.TabularInline):
-    """Invitation families admin view"""
+    """
+    Invitation families admin view
+
+    The invitations are paginated, so an event with thousands of families is still fast to edit
+    """
     autocomplete_fields = ("family", "event")
     model = Event.families.through
     readonly_fields = ('show_mail',)
     form = FamilyInvitationForm
+    formset = PaginatedInlineFormSet
+    template = "admin/invite/edit_inline/paginated_tabular.html"
     extra = 1
     min_num = 0
+    per_page = 50
+    page_var = "invitations_page"
+
+    def get_queryset(self, request):
+        """Select the events mail templates used by the show_mail links"""
+        return super().get_queryset(request).select_related("event__mailtemplate")
+
+    def get_formset(self, request, obj=None, **kwargs):
+        """Create the formset of the requested invitations page"""
+        formset = super().get_formset(request, obj, **kwargs)
+        return type(formset.__name__, (formset,), {
+            "per_page": self.per_page,
+            "page_number": request.GET.get(self.page_var),
+            "page_var": self.page_var,
+        })
 
     @staticmethod
     def show_mail(instance):
@@ -65,7 +151,39 @@ class MailTemplateInline(admin.StackedInline):
     """
     model = MailTemplate
 
-class FamilyInvitationModelAdminMixin(admin.ModelAdmin):
+
+class PurgeActionMixin:
+    """
+    Model admin mixin adding an action deleting the selected objects in bulk (cf. invite.purge)
+
+    An intermediate page asks for the confirmation
+    """
+    purge = None
+
+    def purge_selected(self, request, queryset):
+        """Purge action, delete the selected objects and their related rows in bulk"""
+        opts = self.model._meta  # pylint: disable=protected-access
+        if "apply" in request.POST:
+            counts = self.purge(queryset)
+            self.message_user(request, _("%(count)d %(name)s purged") % {
+                "count": counts[opts.label], "name": opts.verbose_name_plural})
+            return None
+        select_across = request.POST.get("select_across") == "1"
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=opts,
+            title=_("Purge the selected %(name)s") % {"name": opts.verbose_name_plural},
+            select_across=select_across,
+            selected=[] if select_across else request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            action_checkbox_name=helpers.ACTION_CHECKBOX_NAME,
+            count=queryset.count(),
+        )
+        return TemplateResponse(request, "admin/invite/purge_confirmation.html", context)
+    purge_selected.short_description = _("Purge the selected %(verbose_name_plural)s")
+    purge_selected.allowed_permissions = ("delete",)
+
+
+class FamilyInvitationModelAdminMixin(KeysetPaginationMixin, admin.ModelAdmin):
     """
     Mixin model admin for family invitation management
 
@@ -91,19 +209,17 @@ class FamilyInvitationModelAdminMixin(admin.ModelAdmin):
         if family_invitations:
             to_send = (
                 event.gen_mass_email(family)
-                for family, event in family_invitations
-            )
-            send_result = send_mass_html_mail(
-                to_send,
-                reply_to=["{host} <{email}>".format(host=host, email=settings.INVITE_HOSTS[host])
-                          for host in settings.INVITE_HOSTS]
+                for family, event in activate_languages(
+                    sorted(family_invitations, key=lambda invitation: invitation[0].language),
+                    key=lambda invitation: invitation[0].language
+                )
             )
-            messages.add_message(request, messages.INFO,
-                                 _("%(result)d messages send") % {"result": send_result})
+            send_result, report = _send_or_spool(to_send, reply_to=get_host_directory().reply_to)
+            messages.add_message(request, messages.INFO, report % {"result": send_result})
 
 
 @admin.register(Family, site=admin.site)
-class FamilyAdmin(FamilyInvitationModelAdminMixin):
+class FamilyAdmin(PurgeActionMixin, FamilyInvitationModelAdminMixin):
     """
     Family admin view
 
@@ -111,20 +227,125 @@ class FamilyAdmin(FamilyInvitationModelAdminMixin):
     """
     inlines = [InviteInline, AccompanyInline] + FamilyInvitationModelAdminMixin.inlines
     search_fields = ("guests__name", "accompanies__name")
+    actions = ["export_guests", "invite_to_event", "purge_selected"]
+    purge = staticmethod(purge_families)
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Search the families by the beginning of their guests and accompanies names words
+
+        The search use the FamilySearchToken index instead of the search_fields joins, so there is
+        no duplicates to remove
+        """
+        family_ids = FamilySearchToken.objects.search(search_term)
+        if family_ids is not None:
+            queryset = queryset.filter(pk__in=family_ids)
+        return queryset, False
+
+    @staticmethod
+    def export_guests(unused_model_admin, unused_request, families):
+        """
+        Export action, stream the selected families in the importguests csv format
+        """
+        writer = csv.writer(Echo(), quoting=csv.QUOTE_ALL)
+        response = StreamingHttpResponse((writer.writerow(row) for row in export_rows(families)),
+                                         content_type="text/csv")
+        response["Content-Disposition"] = 'attachment; filename="guests.csv"'
+        return response
+    export_guests.short_description = _("Export the guests")
+
+    def invite_to_event(self, request, families):
+        """
+        Invitation action, link the selected families to an event with bulk inserts
+
+        An intermediate page asks for the event, and wether to send it the mail immediately
+        """
+        form = InviteFamiliesForm(request.POST if "apply" in request.POST else None)
+        if form.is_valid():
+            event = form.cleaned_data["event"]
+            if form.cleaned_data["send_mail"] and not event.has_mailtemplate:
+                self.message_user(request, _("The %(events)s has no email template set") %
+                                  {"events": event}, messages.ERROR)
+                return None
+            invited = families.invite(event)
+            self.message_user(request, _("%(invited)d families invited") % {"invited": invited})
+            if form.cleaned_data["send_mail"]:
+                to_send = event.gen_mass_emails(
+                    load_family_records(families.order_by("language", "pk")), request=request
+                )
+                if getattr(settings, "INVITE_UNIQUE_RECIPIENTS", False):
+                    to_send = unique_recipients(to_send)
+                result, report = _send_or_spool(
+                    to_send,
+                    reply_to=get_host_directory().reply_to,
+                    senders=getattr(settings, "INVITE_SEND_THREADS", 1)
+                )
+                self.message_user(request, report % {"result": result})
+            return None
+        select_across = request.POST.get("select_across") == "1"
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,  # pylint: disable=protected-access
+            title=_("Invite the families to an event"),
+            form=form,
+            select_across=select_across,
+            selected=[] if select_across else request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            action_checkbox_name=helpers.ACTION_CHECKBOX_NAME,
+            families_count=families.count(),
+        )
+        return TemplateResponse(request, "admin/invite/family/invite_to_event.html", context)
+    invite_to_event.short_description = _("Invite to an event")
+    invite_to_event.allowed_permissions = ("change",)
 
 
 @admin.register(Event, site=admin.site)
-class EventAdmin(FamilyInvitationModelAdminMixin):
+class EventAdmin(PurgeActionMixin, FamilyInvitationModelAdminMixin):
     """
     Event admin view
 
     This view use FamilyInvitationInline to send an initation to a selection of guests
     """
     exclude = ('families', )
-    actions = ["send_mail"]
+    readonly_fields = ('show_headcount',)
+    actions = ["send_mail", "purge_selected"]
+    purge = staticmethod(purge_events)
     search_fields = ("name", "date")
     inlines = [MailTemplateInline] + FamilyInvitationModelAdminMixin.inlines
 
+    def get_urls(self):
+        """Add the headcount view"""
+        return [
+            path("<int:event_id>/headcount/", self.admin_site.admin_view(self.headcount_view),
+                 name="invite_event_headcount"),
+        ] + super().get_urls()
+
+    def headcount_view(self, request, event_id):
+        """Show the event headcount report, in total and by section"""
+        event = get_object_or_404(Event, pk=event_id)
+        headcount = event.headcount()
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,  # pylint: disable=protected-access
+            original=event,
+            title=_("Headcount of %(event)s") % {"event": event},
+            sections=[(label, headcount[section]) for section, label in (
+                ("total", _("Total")),
+                ("midday", _("Midday")),
+                ("afternoon", _("Afternoon")),
+                ("evening", _("Evening")),
+            )],
+        )
+        return TemplateResponse(request, "admin/invite/event/headcount.html", context)
+
+    @staticmethod
+    def show_headcount(instance):
+        """Extra field adding a link to the headcount report"""
+        if instance.pk:
+            url = reverse('admin:invite_event_headcount', kwargs={"event_id": instance.pk})
+            return format_html(u'<a href="{}">{}</a>', url, _("Show the headcount"))
+        return ""
+    show_headcount.short_description = _("headcount")
+
     def send_mail(self, request, events):
         """
         Email action, send the email to the guest
@@ -140,15 +361,25 @@ class EventAdmin(FamilyInvitationModelAdminMixin):
                               {"events": join_and(events_without_mail)},
                               messages.ERROR)
             return
-        to_send = (
-            invitation.gen_mass_email(family, request=request)
-            for invitation in events
-            for family in invitation.families.all()
-        )
-        result = send_mass_html_mail(
+        merge = getattr(settings, "INVITE_MERGE_EVENTS_MAILS", False)
+        if len(events) > 1:
+            to_send = Event.gen_events_mass_emails(events, request=request, merge=merge)
+        else:
+            to_send = (
+                mass_email
+                for invitation in events
+                for mass_email in invitation.gen_mass_emails(
+                    load_family_records(invitation.families.order_by("language", "pk")),
+                    request=request
+                )
+            )
+        # the messages of several events, not merged, are each sent to the same addresses
+        if getattr(settings, "INVITE_UNIQUE_RECIPIENTS", False) and (len(events) == 1 or merge):
+            to_send = unique_recipients(to_send)
+        result, report = _send_or_spool(
             to_send,
-            reply_to=["{host} <{email}>".format(host=host, email=settings.INVITE_HOSTS[host])
-                      for host in settings.INVITE_HOSTS]
+            reply_to=get_host_directory().reply_to,
+            senders=getattr(settings, "INVITE_SEND_THREADS", 1)
         )
-        self.message_user(request, _("%(result)d messages send") % {"result": result})
+        self.message_user(request, report % {"result": result})
     send_mail.short_description = _("Send the email")
@@ -14,3 +14,4 @@ class InviteConfig(AppConfig):
 
     def ready(self):
         importlib.import_module("invite.checks")
+        importlib.import_module("invite.signals")
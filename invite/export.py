@@ -0,0 +1,81 @@
+"""
+export
+
+Export the guest list in the importguests csv format
+"""
+from django.utils.translation import ugettext as _
+
+from .hosts import get_host_directory
+from .records import load_family_records
+
+HEADER = ("Email", "Phone", "Host", "Gender", "Surname", "Accompany surname")
+SUBTOTAL = ("", "", "", "", "Sous-total", "")
+# the separators importguests splits the names on, but between double quotes
+NAME_SEPARATORS = (",", "&", " et ", " and ")
+
+
+def _join_names(members):
+    """Join the guests or accompanies names, quoting the ones holding a names separator"""
+    separators = NAME_SEPARATORS + (" %s " % _("and"),)
+    return ",".join('"%s"' % member.name if any(sep in member.name for sep in separators)
+                    else member.name for member in members)
+
+
+def _family_row(family, hosts):
+    """The csv row of a family record"""
+    return (
+        ",".join(guest.email or "" for guest in family.guests),
+        ",".join(guest.phone or "" for guest in family.guests),
+        family.host if family.host in hosts else "",
+        ",".join("F" if guest.female else "M" for guest in family.guests),
+        _join_names(family.guests),
+        _join_names(family.accompanies),
+    )
+
+
+def export_rows(families, chunk_size=500):
+    """
+    Generate the csv rows of the families, in the importguests format
+
+    importguests deduce the invited parts of the families from their position around the two
+    "Sous-total" lines, so the families are exported in 3 sections : invited on lunch, invited
+    the afternoon, and invited at the party only. The families invited on lunch but not the
+    afternoon can not be represented : they are exported in the first section.
+
+    The importguests format can not hold all the families data, so an export imported again
+    loses :
+
+    - the families not invited in the evening, which are imported as invited ;
+    - the families without any guest email, whose rows importguests ignores ;
+    - the accompanies number, which importguests deduces from their name (2 for "children",
+      "girls"... and 1 otherwise) ;
+    - the double quotes of the names, as the names holding a separator are written between
+      double quotes to be imported whole ;
+    - the families language.
+
+    The families are loaded chunk by chunk, so the memory does not depend on the families count.
+
+    :param families: the Family queryset to export
+    :param chunk_size: the number of families loaded per query
+    :return: a generator of csv rows
+    """
+    hosts = get_host_directory()
+    sections = (
+        families.filter(invited_midday=True),
+        families.filter(invited_midday=False, invited_afternoon=True),
+        families.filter(invited_midday=False, invited_afternoon=False),
+    )
+    yield HEADER
+    for i, section in enumerate(sections):
+        if i:
+            yield SUBTOTAL
+        for family in load_family_records(section.order_by("pk"), chunk_size=chunk_size):
+            yield _family_row(family, hosts)
+
+
+class Echo:  # pylint: disable=too-few-public-methods
+    """File like object returning the written value, to stream a csv writer"""
+    @staticmethod
+    def write(value):
+        """Return the written value"""
+        return value
@@ -0,0 +1,54 @@
+"""
+hosts
+
+The INVITE_HOSTS directory with its preformatted email headers
+"""
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+_DIRECTORY = None
+
+
+class HostDirectory:
+    """
+    The hosts from the INVITE_HOSTS setting with their formatted "From" and "Reply-To" headers
+
+    Use get_host_directory to retrieve the directory of the current settings
+    """
+    def __init__(self, hosts, use_host_in_from_email=False):
+        """
+        :param hosts: the host name -> email dict
+        :param use_host_in_from_email: use the family host as mail sender
+        """
+        self.hosts = dict(hosts)
+        self.addresses = {host: "{host} <{email}>".format(host=host, email=email)
+                          for host, email in self.hosts.items()}
+        self.reply_to = list(self.addresses.values())
+        self.use_host_in_from_email = use_host_in_from_email
+
+    def from_email(self, host):
+        """The from email to use for a family host : None to use the default from email"""
+        if self.use_host_in_from_email:
+            return self.addresses.get(host)
+        return None
+
+    def __contains__(self, host):
+        return host in self.hosts
+
+
+def get_host_directory() -> HostDirectory:
+    """Retrieve the host directory of the current settings"""
+    global _DIRECTORY  # pylint: disable=global-statement
+    if _DIRECTORY is None:
+        _DIRECTORY = HostDirectory(getattr(settings, "INVITE_HOSTS", {}),
+                                   getattr(settings, "INVITE_USE_HOST_IN_FROM_EMAIL", False))
+    return _DIRECTORY
+
+
+@receiver(setting_changed)
+def clear_host_directory(setting, **unused_kwargs):
+    """Clear the host directory when the hosts settings changed"""
+    global _DIRECTORY  # pylint: disable=global-statement
+    if setting in {"INVITE_HOSTS", "INVITE_USE_HOST_IN_FROM_EMAIL"}:
+        _DIRECTORY = None
@@ -1,14 +1,35 @@
 """
 join_and utils
 """
-from django.utils.translation import ugettext_lazy as _
+from functools import lru_cache
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.translation import get_language, gettext as _
+
+
+@lru_cache(maxsize=None)
+def _localized_and(unused_language):
+    """
+    Retrieve the " and " conjunction of a language
+
+    The language is only the cache key : gettext translate with the active language
+    """
+    return " " + _('and') + " "
+
+
+@receiver(setting_changed)
+def clear_localized_and(setting, **unused_kwargs):
+    """Clear the conjunctions cache when the translations settings changed"""
+    if setting in {"LANGUAGES", "LANGUAGE_CODE", "LOCALE_PATHS"}:
+        _localized_and.cache_clear()
 
 
 def join_and(listed):
     """
     Create a "," and "and" sentence from a list of string
 
-    :param listed: the list string to join with comma and "and"
+    :param listed: the list string (or any iterable of strings) to join with comma and "and"
     :return: the list join by "," and "and"
 
     for example,
@@ -18,11 +39,22 @@ def join_and(listed):
     would return : "Jean, Paul and Marie"
     (where "and" is localized)
     """
-    if not listed:
+    if isinstance(listed, (list, tuple)):
+        if not listed:
+            return ''
+        if len(listed) == 1:
+            return listed[0]
+        if len(listed) == 2:
+            return listed[0] + _localized_and(get_language()) + listed[1]
+        return ', '.join(listed[:-1]) + _localized_and(get_language()) + listed[-1]
+    iterator = iter(listed)
+    last = next(iterator, None)
+    if last is None:
         return ''
-    if len(listed) == 1:
-        return listed[0]
-    localized_and = " " + str(_('and')) + " "
-    if len(listed) == 2:
-        return listed[0] + localized_and + listed[1]
-    return ', '.join(listed[:-1]) + localized_and + listed[-1]
+    heads = []
+    for item in iterator:
+        heads.append(last)
+        last = item
+    if not heads:
+        return last
+    return ', '.join(heads) + _localized_and(get_language()) + last
@@ -0,0 +1,64 @@
+"""
+lazy_context
+
+Read only template context whose values are computed on first access
+"""
+from collections.abc import Mapping
+
+
+class LazyContext(Mapping):
+    """
+    Read only mapping computing each value on first access and memoizing it
+
+    The factories are callables receiving the context itself, so a value can depend on another
+    one without computing it twice. A parent mapping can be given to layer a context on top of
+    another one without copying it, for example:
+    ```
+    family_context = LazyContext({"count": lambda context: 2}, {"family": family})
+    event_context = LazyContext({}, {"event": event}, parent=family_context)
+    ```
+    """
+    def __init__(self, factories, values=None, parent=None):
+        """
+        :param factories: the dict of key -> callable(context) computing the value of the key
+        :param values: the dict of already known values
+        :param parent: the mapping to lookup the keys unknown to this context
+        """
+        self._factories = factories
+        self._values = dict(values or {})
+        self._parent = parent
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        if key in self._factories:
+            value = self._values[key] = self._factories[key](self)
+            return value
+        if self._parent is not None:
+            return self._parent[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._values or key in self._factories or \
+            (self._parent is not None and key in self._parent)
+
+    def _own_keys(self):
+        """List the keys of this context without the parent ones"""
+        keys = list(self._values)
+        keys.extend(key for key in self._factories if key not in self._values)
+        return keys
+
+    def __iter__(self):
+        keys = self._own_keys()
+        yield from keys
+        if self._parent is not None:
+            own_keys = set(keys)
+            yield from (key for key in self._parent if key not in own_keys)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return "<%s %s>" % (type(self).__name__, self._own_keys())
@@ -0,0 +1,53 @@
+"""
+exportguests command
+
+Export the guest list in a csv file readable by the importguests command
+"""
+import csv
+
+from django.core.management import BaseCommand, CommandParser
+from django.utils.translation import ugettext_lazy as _
+
+from ...export import export_rows
+from ...models import Family
+
+
+class Command(BaseCommand):
+    """
+The csv is written in the importguests format (see importguests --help). The families are read
+by chunks, so the memory does not depend on the number of families ::
+
+    python manage.py exportguests guestlist.csv
+
+Export only the families invited to an event ::
+
+    python manage.py exportguests --event 1 guestlist.csv
+
+The evening invitation, the accompanies number and the families language are not exported, and
+the families without email are not imported again (see invite.export.export_rows).
+    """
+    help = _("Export guests to a csv file")
+
+    def add_arguments(self, parser: CommandParser):
+        parser.add_argument("--event", dest="event_id", type=int,
+                            help=_("id of the event to export the families of"))
+        parser.add_argument("--chunk-size", dest="chunk_size", type=int, default=500,
+                            help=_("number of families read per query"))
+        parser.add_argument("csv", nargs="?", default="-",
+                            help=_("path to the csv file to write (default to the output)"))
+
+    def handle(self, *args, **options):
+        """Write the csv"""
+        families = Family.objects.all()
+        if options["event_id"]:
+            families = families.filter(invitations=options["event_id"])
+        if options["csv"] == "-":
+            self.write(self.stdout, families, options["chunk_size"])
+        else:
+            with open(options["csv"], 'w', newline='') as csv_file:
+                self.write(csv_file, families, options["chunk_size"])
+
+    @staticmethod
+    def write(csv_file, families, chunk_size):
+        """Write the families csv in the file"""
+        csv.writer(csv_file, quoting=csv.QUOTE_ALL).writerows(export_rows(families, chunk_size))
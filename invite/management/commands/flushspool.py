@@ -0,0 +1,50 @@
+"""
+flushspool command
+
+Send the messages written to the spool directory (see the INVITE_SPOOL_DIR setting)
+"""
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError, CommandParser
+from django.utils.translation import ugettext_lazy as _
+
+from ...spool import CUR, FAILED, flush_spool, requeue
+
+
+class Command(BaseCommand):
+    """
+When INVITE_SPOOL_DIR is set, the admin actions write the mails to the spool directory instead of
+sending them. Send them, moving each message to the sent or failed sub directory ::
+
+    python manage.py flushspool
+
+Send the failed messages again ::
+
+    python manage.py flushspool --retry-failed
+
+Each message is first moved to the cur sub directory, so the concurrent flushes do not send it
+twice. Once no flush is running, send again the messages left there by an interrupted flush ::
+
+    python manage.py flushspool --retry-interrupted
+    """
+    help = _("Send the spooled mails")
+
+    def add_arguments(self, parser: CommandParser):
+        parser.add_argument("--spool-dir", default=getattr(settings, "INVITE_SPOOL_DIR", None),
+                            help=_("the spool directory (INVITE_SPOOL_DIR by default)"))
+        parser.add_argument("--retry-failed", action="store_true",
+                            help=_("send the failed messages again"))
+        parser.add_argument("--retry-interrupted", action="store_true",
+                            help=_("send again the messages of an interrupted flush (when no "
+                                   "other flush is running)"))
+
+    def handle(self, *args, **options):
+        """Flush the spool"""
+        spool_dir = options["spool_dir"]
+        if not spool_dir:
+            raise CommandError("No spool directory : set INVITE_SPOOL_DIR or --spool-dir")
+        if options["retry_failed"]:
+            self.stdout.write("%d failed messages requeued" % requeue(spool_dir, FAILED))
+        if options["retry_interrupted"]:
+            self.stdout.write("%d interrupted messages requeued" % requeue(spool_dir, CUR))
+        sent, failed = flush_spool(spool_dir)
+        self.stdout.write("%d messages sent, %d failed" % (sent, failed))
@@ -0,0 +1,42 @@
+"""
+freezeevents command
+
+Snapshot (or invalidate the snapshots of) the families contexts of finalized events
+"""
+from django.core.management import BaseCommand, CommandError, CommandParser
+from django.utils.translation import ugettext_lazy as _
+
+from ...models import Event
+
+
+class Command(BaseCommand):
+    """
+Once frozen, the event mails are rendered from the families contexts snapshots instead of the
+guests and accompanies data. Freeze an event again to refresh its snapshots ::
+
+    python manage.py freezeevents 1 2
+
+Invalidate the snapshots to render the event mails from the guests data again ::
+
+    python manage.py freezeevents --invalidate 1 2
+    """
+    help = _("Snapshot the families contexts of events")
+
+    def add_arguments(self, parser: CommandParser):
+        parser.add_argument("events", nargs="+", type=int, help=_("ids of the events"))
+        parser.add_argument("--invalidate", action="store_true",
+                            help=_("delete the events snapshots instead of creating them"))
+
+    def handle(self, *args, **options):
+        """Freeze or invalidate the events"""
+        events = Event.objects.filter(pk__in=options["events"])
+        missing = set(options["events"]) - {event.pk for event in events}
+        if missing:
+            raise CommandError("Unknown events : %s" % ", ".join(map(str, sorted(missing))))
+        for event in events:
+            if options["invalidate"]:
+                event.unfreeze()
+                self.stdout.write("%s : snapshots invalidated" % event)
+            else:
+                count = event.freeze()
+                self.stdout.write("%s : %d families frozen" % (event, count))
@@ -9,15 +9,23 @@ import csv
 import itertools
 import logging
 import operator
+import re
 from argparse import RawDescriptionHelpFormatter
+from collections import Counter, namedtuple
+from multiprocessing import Pool
 
+import django
 from django.conf import settings
-from django.core.management import BaseCommand, CommandParser
+from django.core.exceptions import ValidationError
+from django.core.management import BaseCommand, CommandError, CommandParser
+from django.core.validators import validate_email
+from django.db import connection, connections, transaction
 from django.utils.dateparse import parse_date
 from django.utils.translation import ugettext_lazy as _
 
 from ...join_and import join_and
-from ...models import Family, Guest, Accompany, Event
+from ...models import Family, Guest, Accompany, Event, FamilySearchToken
+from ...records import AccompanyRecord, GuestRecord, load_family_records
 
 MANY_LIST = ['children', 'girls', 'boys', 'colleges']
 EMAIL_KEY = "Email"
@@ -26,6 +34,7 @@ HOST_KEY = "Host"
 GENDER_KEY = "Gender"
 SURNAME_KEY = "Surname"
 ACCOMPANY_KEY = "Accompany surname"
+BATCH_SIZE = 500
 
 
 def strip(listed):
@@ -34,26 +43,96 @@ def strip(listed):
 
 
 def multi_split(string, *seps):
-    """split a list of separators"""
-    split = [string]
-    for sep in seps:
-        split = itertools.chain.from_iterable(map(operator.methodcaller('split', sep), split))
+    """split a list of separators, but between double quotes (which are removed)"""
+    split = [""]
+    position = 0
+    for match in re.finditer("|".join(['"[^"]*"'] + [re.escape(sep) for sep in seps]), string):
+        split[-1] += string[position:match.start()]
+        if match.group().startswith('"'):
+            split[-1] += match.group()[1:-1]
+        else:
+            split.append("")
+        position = match.end()
+    split[-1] += string[position:]
     return split
 
 
-def _create_guests(line):
+class ImportReport:
+    """
+    Aggregate of the csv validation issues : their count by kind and a few examples of each kind
+    with their line number
+
+    Without report, the issues are logged as warnings.
+    """
+    def __init__(self, max_examples=5):
+        self.max_examples = max_examples
+        self.counts = Counter()
+        self.examples = {}
+        self.families = 0
+
+    def add(self, kind, line_num, message):
+        """Count an issue, and keep it as example if there is not already enough examples"""
+        self.counts[kind] += 1
+        examples = self.examples.setdefault(kind, [])
+        if len(examples) < self.max_examples:
+            examples.append((line_num, message))
+
+    def lines(self):
+        """Generate the report lines"""
+        yield "%d families, %d issues" % (self.families, sum(self.counts.values()))
+        for kind, count in self.counts.most_common():
+            yield "%s : %d" % (kind, count)
+            for line_num, message in self.examples[kind]:
+                yield "  line %d : %s" % (line_num, message)
+
+
+def _warn(report, kind, line_num, message, *args):
+    """Report a csv issue, or log it without report"""
+    if report is None:
+        logging.warning(message, *args)
+    else:
+        report.add(kind, line_num, message % args)
+
+
+def _check_length(report, line_num, model, field, value):
+    """Report a csv value too long for its model field"""
+    max_length = model._meta.get_field(field).max_length  # pylint: disable=protected-access
+    if value and len(value) > max_length:
+        _warn(report, "too long", line_num, "%s %s longer than %d characters", field, value,
+              max_length)
+
+
+def _create_guests(line, report=None, line_num=None):
     """Create the guests list from the csv line"""
     emails = list(strip(line[EMAIL_KEY].split(',')))
     phones = list(strip(line[PHONE_KEY].split(',')))
     gender = list(strip(line[GENDER_KEY].split(',')))
     names = list(strip(multi_split(line[SURNAME_KEY], ',', ' et ', '&')))
     for i, name in enumerate(names):
-        if i > len(gender):
-            logging.warning("missing gender to %s : SKIPPED", name)
+        if not name:
+            _warn(report, "missing surname", line_num, "missing surname : SKIPPED")
+        elif i >= len(gender):
+            _warn(report, "missing gender", line_num, "missing gender to %s : SKIPPED", name)
         else:
+            if not gender[i]:
+                _warn(report, "empty gender", line_num, "empty gender to %s : imported as male",
+                      name)
+            elif gender[i].upper() not in ('F', 'M'):
+                _warn(report, "invalid gender", line_num, "invalid gender %s to %s", gender[i],
+                      name)
+            email = emails[i] if len(emails) > i else None
+            if email:
+                try:
+                    validate_email(email)
+                except ValidationError:
+                    _warn(report, "invalid email", line_num, "invalid email %s to %s", email,
+                          name)
+            phone = phones[i] if len(phones) > i else ""
+            _check_length(report, line_num, Guest, "name", name)
+            _check_length(report, line_num, Guest, "phone", phone)
             yield Guest(name=name,
-                        email=emails[i] if len(emails) > i else None,
-                        phone=phones[i] if len(phones) > i else "",
+                        email=email,
+                        phone=phone,
                         female=gender[i].upper() == 'F')
 
 
@@ -66,6 +145,173 @@ def _create_accompagnies(line):
                             number=1 if all(str(_(many)) not in name for many in MANY_LIST) else 2)
 
 
+FamilyRow = namedtuple("FamilyRow", ("line_num", "fields", "guests", "accompanies"))
+
+
+def read_families(csv_file, report=None):
+    """
+    Parse the families of a csv file
+
+    :param csv_file: the csv file
+    :param report: the ImportReport collecting the issues (default : log them)
+    :return: a generator of FamilyRow
+    """
+    csv_reader = csv.DictReader(csv_file, [
+        EMAIL_KEY, PHONE_KEY, HOST_KEY, GENDER_KEY, SURNAME_KEY, ACCOMPANY_KEY
+    ])
+    next(csv_reader, None)  # skip 1st line
+    midday = True
+    afternoon = True
+    evening = True
+    for line in csv_reader:
+        if line[SURNAME_KEY] == "Sous-total":
+            if midday:
+                midday = False
+            else:
+                afternoon = False
+        if any(strip(line[EMAIL_KEY].split(','))):
+            if line[HOST_KEY] and line[HOST_KEY] not in settings.INVITE_HOSTS:
+                _warn(report, "unknown host", csv_reader.line_num,
+                      "%s source not referenced in the setting INVITE_HOSTS", line[HOST_KEY])
+            host = line[HOST_KEY] if line[HOST_KEY] in settings.INVITE_HOSTS else \
+                join_and(settings.INVITE_HOSTS)
+            _check_length(report, csv_reader.line_num, Family, "host", host)
+            if report is not None:
+                report.families += 1
+            yield FamilyRow(csv_reader.line_num,
+                            {"invited_midday": midday, "invited_afternoon": afternoon,
+                             "invited_evening": evening, "host": host},
+                            list(_create_guests(line, report, csv_reader.line_num)),
+                            list(_create_accompagnies(line)))
+
+
+def add_members(family_rows):
+    """
+    Insert the guests and accompanies of csv rows in bulk, then refresh their families search
+    tokens at once
+
+    :param family_rows: the (family id, FamilyRow) pairs
+    """
+    guests = []
+    accompanies = []
+    for family_id, row in family_rows:
+        for member in row.guests:
+            member.family_id = family_id
+            guests.append(member)
+        for member in row.accompanies:
+            member.family_id = family_id
+            accompanies.append(member)
+    Guest.objects.bulk_create(guests, batch_size=BATCH_SIZE)
+    Accompany.objects.bulk_create(accompanies, batch_size=BATCH_SIZE)
+    FamilySearchToken.objects.refresh([family_id for family_id, _row in family_rows])
+
+
+def create_families(rows):
+    """
+    Create the families of csv rows, with their guests and accompanies
+
+    The families are inserted in bulk when the database returns the inserted ids (PostgreSQL), one
+    by one otherwise. Their guests and accompanies are always inserted in bulk, without the per
+    member signals.
+
+    :param rows: the list of csv FamilyRow
+    :return: the created families ids
+    """
+    families = [Family(**row.fields) for row in rows]
+    if connection.features.can_return_ids_from_bulk_insert:
+        Family.objects.bulk_create(families, batch_size=BATCH_SIZE)
+    else:
+        for family in families:
+            family.save()
+    add_members([(family.pk, row) for family, row in zip(families, rows)])
+    return [family.pk for family in families]
+
+
+def import_rows(rows, event=None):
+    """
+    Create the families of csv rows
+
+    :param rows: the csv FamilyRow
+    :param event: the event to link the families to (invalidating its headcount once)
+    :return: the number of created families
+    """
+    family_ids = create_families(list(rows))
+    if event:
+        event.invite(family_ids)
+    return len(family_ids)
+
+
+def _init_shard_worker():
+    """Initialize an import worker process : it will open its own database connection"""
+    django.setup()
+
+
+def _import_shard(shard):
+    """Import a shard of csv rows in its own transaction"""
+    rows, event = shard
+    with transaction.atomic():
+        return import_rows(rows, event)
+
+
+def split_shards(rows, shards):
+    """
+    Split the rows in contiguous ranges of (almost) the same size
+
+    :param rows: the list of rows
+    :param shards: the number of ranges
+    :return: the list of the non empty ranges
+    """
+    size, remainder = divmod(len(rows), shards)
+    ranges = []
+    start = 0
+    for index in range(shards):
+        stop = start + size + (1 if index < remainder else 0)
+        if stop > start:
+            ranges.append(rows[start:stop])
+        start = stop
+    return ranges
+
+
+def import_shards(rows, shards, event=None):
+    """
+    Import the csv rows by ranges, each range in its own process, connection and transaction
+
+    The rows are parsed sequentially beforehand, so each row already has its "Sous-total" section
+    flags and the import result is the same as the serial import (but for the families order). As
+    SQLite serializes the writes and the test in-memory databases are not shared between
+    processes, the rows are imported serially on SQLite. They are also imported serially inside a
+    transaction, which the workers could not see and closing the connection would break.
+
+    :param rows: the list of csv FamilyRow
+    :param shards: the number of processes
+    :param event: the event to link the families to
+    :return: the number of created families
+    """
+    ranges = split_shards(rows, shards)
+    if len(ranges) < 2 or connection.vendor == "sqlite" or connection.in_atomic_block:
+        return sum(_import_shard((rows_range, event)) for rows_range in ranges)
+    connections.close_all()  # the worker processes must not share the current connection
+    with Pool(len(ranges), _init_shard_worker) as pool:
+        return sum(pool.map(_import_shard, [(rows_range, event) for rows_range in ranges]))
+
+
+def family_key(guests):
+    """
+    The key matching a family : the set of its guests emails, case insensitive
+
+    Renaming or reordering the guests keeps the key. The families without any guest email can not
+    be written in the csv : their key is empty.
+    """
+    return frozenset(email.strip().lower() for email in (guest.email for guest in guests)
+                     if email and email.strip())
+
+
+def member_values(members, record_class):
+    """The records of unsaved guests or accompanies, to compare them with the existing ones"""
+    return [record_class(*(getattr(member, field) for field in record_class._fields))
+            for member in members]
+
+
 class Command(BaseCommand):
     """
 csv format is like::
@@ -95,9 +341,22 @@ csv format is like::
     "","", "", "", "M", ""
     "","", "", "", "F", ""
 
++ The *Surname* and *Accompany surname* between double quotes are not split ::
+
+    "marie@example.com","","Pierre","F","\"Marie, Anne\""
+
 + Lines without "email" are ignored ::
 
     "","ignored", "", "", "", ""
+    ",","ignored", "", "M,F", "Jean,Marie", ""
+
++ With *--sync*, the families are matched with the existing ones by their guests emails set :
+  only the changed families are updated, the new ones created and the missing ones deleted. The
+  families without any guest email are kept
++ With *--shards*, the csv is parsed then split in ranges, each imported by its own process, with
+  its own database connection and transaction
++ With *--dry-run*, the csv is only validated : the issues are reported by kind, with the line
+  number of their first occurrences, and nothing is written to the database
     """
     help = _("Import guests from a csv file")
 
@@ -114,41 +373,119 @@ csv format is like::
                                 help=_("date of the event"))
         invitation.add_argument("--name", dest="event_name", type=str,
                                 help=_("name of the event"))
+        parser.add_argument("--sync", action="store_true",
+                            help=_("update the existing families (matched by their guests "
+                                   "emails) and delete the ones missing from the csv, instead "
+                                   "of creating all the families"))
+        parser.add_argument("--dry-run", action="store_true",
+                            help=_("only validate the csv and report its issues, without "
+                                   "writing to the database"))
+        parser.add_argument("--shards", type=int, default=1,
+                            help=_("number of processes importing the csv rows ranges in "
+                                   "parallel, each with its own database connection"))
         parser.add_argument("csv", help=_("path to the csv file to parse"))
 
     def handle(self, *args, **options):
         """Process to the parsing of the csv"""
+        if options["dry_run"]:
+            report = ImportReport()
+            with open(options["csv"], 'r') as csv_file:
+                for _row in read_families(csv_file, report):
+                    pass
+            for line in report.lines():
+                self.stdout.write(line)
+            return
+        if options["shards"] > 1 and options["sync"]:
+            raise CommandError("--shards can not be used with --sync")
         event = self.create_event(**options)
         with open(options["csv"], 'r') as csv_file:
-            csv_reader = csv.DictReader(csv_file, [
-                EMAIL_KEY, PHONE_KEY, HOST_KEY, GENDER_KEY, SURNAME_KEY, ACCOMPANY_KEY
-            ])
-            next(csv_reader)  # skip 1st line
-            midday = True
-            afternoon = True
-            evening = True
-            for line in csv_reader:
-                if line[SURNAME_KEY] == "Sous-total":
-                    if midday:
-                        midday = False
-                    else:
-                        afternoon = False
-                if line[EMAIL_KEY]:
-                    if line[HOST_KEY] and line[HOST_KEY] not in settings.INVITE_HOSTS:
-                        logging.warning("%s source not referenced in the setting INVITE_HOSTS",
-                                        line[HOST_KEY])
-                    host = line[HOST_KEY] if line[HOST_KEY] in settings.INVITE_HOSTS else \
-                        join_and(list(settings.INVITE_HOSTS.keys()))
-                    guests = _create_guests(line)
-                    accompagies = _create_accompagnies(line)
-                    family = Family.objects.create(invited_midday=midday,
-                                                   invited_afternoon=afternoon,
-                                                   invited_evening=evening,
-                                                   host=host)
-                    family.guests.add(*guests, bulk=False)
-                    family.accompanies.add(*accompagies, bulk=False)
-                    if event:
-                        family.invitations.add(event)
+            rows = read_families(csv_file)
+            if options["sync"]:
+                with transaction.atomic():
+                    self.sync(rows, event)
+            elif options["shards"] > 1:
+                import_shards(list(rows), options["shards"], event)
+            else:
+                import_rows(rows, event)
+
+    def sync(self, rows, event=None):
+        """
+        Synchronize the existing families with the csv rows
+
+        The families are matched by their guests emails set : renaming or reordering the guests
+        updates the family, keeping its invitations. Only the new, changed and missing families
+        are written, in bulk when possible. The existing families left unmatched, like the ones
+        duplicated by a previous import, are deleted. The families without any guest email are
+        kept untouched, as the csv can not express them.
+
+        :param rows: the csv FamilyRow
+        :param event: the event to link the csv families to
+        """
+        existing = {}
+        for family in load_family_records(Family.objects.order_by("pk")):
+            key = family_key(family.guests)
+            if key:
+                existing.setdefault(key, []).append(family)
+        seen_ids = set()
+        updated = unchanged = 0
+        new_rows = []
+        changed_members = []
+        updated_ids = []
+        for row in rows:
+            family = self.pop_family(existing.get(family_key(row.guests)), row)
+            if family is None:
+                new_rows.append(row)
+                continue
+            changed = False
+            if row.fields != {field: getattr(family, field) for field in row.fields}:
+                Family.objects.filter(pk=family.pk).update(**row.fields)
+                changed = True
+            if member_values(row.guests, GuestRecord) != family.guests or \
+                    member_values(row.accompanies, AccompanyRecord) != family.accompanies:
+                changed_members.append((family.pk, row))
+                changed = True
+            if changed:
+                updated_ids.append(family.pk)
+                updated += 1
+            else:
+                unchanged += 1
+            seen_ids.add(family.pk)
+        self.replace_members(changed_members)
+        Event.invalidate_families_headcounts(updated_ids)
+        seen_ids.update(create_families(new_rows))
+        deleted_ids = [family.pk for families in existing.values() for family in families]
+        for start in range(0, len(deleted_ids), BATCH_SIZE):
+            Family.objects.filter(pk__in=deleted_ids[start:start + BATCH_SIZE]).delete()
+        if event:
+            event.invite(seen_ids)
+        self.stdout.write("%d created, %d updated, %d deleted, %d unchanged" % (
+            len(new_rows), updated, len(deleted_ids), unchanged))
+
+    @staticmethod
+    def pop_family(families, row):
+        """
+        Remove the existing family matching a csv row from the families sharing its key
+
+        :param families: the FamilyRecord sharing the row key, ordered by id (or None)
+        :param row: the csv FamilyRow
+        :return: the family with the same guests, or the first one, or None without any family
+        """
+        if not families:
+            return None
+        guests = member_values(row.guests, GuestRecord)
+        family = next((family for family in families if family.guests == guests), families[0])
+        families.remove(family)
+        return family
+
+    @staticmethod
+    def replace_members(changed_members):
+        """Replace the guests and accompanies of the changed families by the csv ones"""
+        family_ids = [family_id for family_id, _row in changed_members]
+        for start in range(0, len(family_ids), BATCH_SIZE):
+            batch = family_ids[start:start + BATCH_SIZE]
+            Guest.objects.filter(family_id__in=batch).delete()
+            Accompany.objects.filter(family_id__in=batch).delete()
+        add_members(changed_members)
 
     @staticmethod
     def create_event(event_date, event_name, **unused_options):
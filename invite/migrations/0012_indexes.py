@@ -0,0 +1,33 @@
+# Generated by Django 2.1.15 on 2026-10-19 15:25
+# pylint: disable=invalid-name
+"""
+Add the guests and accompanies lookup indexes
+
+The (event, family) unicity of the event families table is already ensured by the many to many
+table unique constraint
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Migration to apply
+    """
+    dependencies = [
+        ('invite', '0011_fill_mailtemplate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accompany',
+            index=models.Index(fields=['family', 'female'], name='invite_accompany_family_female'),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['family', 'female'], name='invite_guest_family_female'),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['email'], name='invite_guest_email'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 2.1.15 on 2026-10-19 15:27
+# pylint: disable=invalid-name
+"""
+Add the families search tokens and fill them from the existing guests and accompanies
+"""
+from django.db import migrations, models
+import django.db.models.deletion
+
+from .operations import fill_search_tokens
+
+
+class Migration(migrations.Migration):
+    """
+    Migration to apply
+    """
+    dependencies = [
+        ('invite', '0012_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FamilySearchToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False,
+                                        verbose_name='ID')),
+                ('token', models.CharField(db_index=True, max_length=64, verbose_name='token')),
+                ('family', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                             related_name='search_tokens', to='invite.Family',
+                                             verbose_name='family')),
+            ],
+            options={
+                'verbose_name': 'search token',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='familysearchtoken',
+            unique_together={('family', 'token')},
+        ),
+        migrations.RunPython(fill_search_tokens.code, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 2.1.15 on 2026-10-19 15:30
+# pylint: disable=invalid-name
+"""
+Add the families context snapshots of the frozen events
+"""
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    """
+    Migration to apply
+    """
+    dependencies = [
+        ('invite', '0013_familysearchtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FamilyContextSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False,
+                                        verbose_name='ID')),
+                ('context', models.TextField(verbose_name='json context')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                            related_name='snapshots', to='invite.Event',
+                                            verbose_name='event')),
+                ('family', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                             related_name='snapshots', to='invite.Family',
+                                             verbose_name='family')),
+            ],
+            options={
+                'verbose_name': 'family context snapshot',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='familycontextsnapshot',
+            unique_together={('event', 'family')},
+        ),
+    ]
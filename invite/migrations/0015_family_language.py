@@ -0,0 +1,25 @@
+# Generated by Django 2.1.15 on 2026-10-19 15:49
+# pylint: disable=invalid-name
+"""
+Add the families language
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Migration to apply
+    """
+    dependencies = [
+        ('invite', '0014_familycontextsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='family',
+            name='language',
+            field=models.CharField(blank=True, help_text='code of one of the LANGUAGES setting, '
+                                                         'empty for the default language',
+                                   max_length=15, verbose_name='language'),
+        ),
+    ]
@@ -3,9 +3,15 @@ Migrations operations
 
 Created by lmarvaud on 31/01/2019
 """
+import hashlib
+from itertools import islice
+
 from django.apps.registry import Apps
+from django.db.models.functions import Length
 from django.template.loader import get_template
 
+BATCH_SIZE = 500
+
 
 def _get_template(path: str) -> str:
     """Retrieve a template source for a path"""
@@ -21,26 +27,50 @@ def _get_mail_templates() -> tuple:
     return subject, text, html
 
 
-def code(apps: Apps, unused_schema_editor=None):
-    """Create the mail templates for all existing events"""
+def _content_hash(subject: str, text: str, html: str) -> bytes:
+    """Hash a mail template content"""
+    content = hashlib.sha1()
+    for part in (subject, text, html):
+        content.update(part.encode())
+        content.update(b"\0")
+    return content.digest()
+
+
+def code(apps: Apps, unused_schema_editor=None, batch_size=BATCH_SIZE):
+    """Create the mail templates for all existing events which do not have one yet"""
     mailtemplate_class = apps.get_model("invite", "MailTemplate")
     event_class = apps.get_model("invite", "Event")
     subject, text, html = _get_mail_templates()
-    for event in event_class.objects.all():
-        mailtemplate_class.objects.create(
-            event=event,
-            subject=subject,
-            text=text,
-            html=html,
+    event_ids = event_class.objects.filter(mailtemplate__isnull=True) \
+        .values_list("pk", flat=True).iterator(chunk_size=batch_size)
+    batch = list(islice(event_ids, batch_size))
+    while batch:
+        mailtemplate_class.objects.bulk_create(
+            mailtemplate_class(event_id=event_id, subject=subject, text=text, html=html)
+            for event_id in batch
         )
+        batch = list(islice(event_ids, batch_size))
+
 
+def reverse_code(apps: Apps, unused_schema_editor=None, batch_size=BATCH_SIZE):
+    """
+    Delete the unmodified mail templates
 
-def reverse_code(apps: Apps, unused_schema_editor=None):
-    """Create the mail templates for all existing events"""
+    Only the templates with the default templates lengths are read, and they are compared to the
+    default templates through their content hash.
+    """
     mailtemplate_class = apps.get_model("invite", "MailTemplate")
     subject, text, html = _get_mail_templates()
-    mailtemplate_class.objects.filter(
-        subject=subject,
-        text=text,
-        html=html
-    ).delete()
+    default_hash = _content_hash(subject, text, html)
+    candidates = mailtemplate_class.objects.annotate(
+        subject_length=Length("subject"),
+        text_length=Length("text"),
+        html_length=Length("html"),
+    ).filter(
+        subject_length=len(subject),
+        text_length=len(text),
+        html_length=len(html),
+    ).values_list("pk", "subject", "text", "html").iterator(chunk_size=batch_size)
+    unmodified = [pk for pk, *content in candidates if _content_hash(*content) == default_hash]
+    for start in range(0, len(unmodified), batch_size):
+        mailtemplate_class.objects.filter(pk__in=unmodified[start:start + batch_size]).delete()
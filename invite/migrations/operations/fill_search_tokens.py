@@ -0,0 +1,17 @@
+"""
+Migrations operations filling the families search tokens
+"""
+from django.apps.registry import Apps
+
+from ...search import refresh_tokens
+
+
+def code(apps: Apps, unused_schema_editor=None):
+    """Create the search tokens of all existing families"""
+    family_class = apps.get_model("invite", "Family")
+    refresh_tokens(
+        apps.get_model("invite", "FamilySearchToken"),
+        apps.get_model("invite", "Guest"),
+        apps.get_model("invite", "Accompany"),
+        family_class.objects.values_list("pk", flat=True).iterator(),
+    )
@@ -46,6 +46,22 @@ class TestCode(TestEventMixin, TestCase):
         self.assertEqual(self.event.mailtemplate.text, "Template source")
         self.assertEqual(self.event.mailtemplate.html, "Template source")
 
+    def test_code_existing(self, get_template_mock: Mock):
+        """
+        Test the migration code keeps the existing templates
+
+        :param get_template_mock: the get_template function mock
+        """
+        MailTemplate.objects.create(event=self.event, text="Modified source",
+                                    html="Modified source", subject="Modified source")
+
+        fill_mailtemplate.code(apps)
+        self.event.refresh_from_db()
+
+        self.assert_get_template_has_calls(get_template_mock)
+        self.assertEqual(MailTemplate.objects.filter(event=self.event).count(), 1)
+        self.assertEqual(self.event.mailtemplate.subject, "Modified source")
+
     def test_reverse_code(self, get_template_mock):
         """
         Test reverse function of the migration
@@ -61,6 +77,21 @@ class TestCode(TestEventMixin, TestCase):
         self.assert_get_template_has_calls(get_template_mock)
         self.assertFalse(self.event.has_mailtemplate)
 
+    def test_reverse_code_same_length(self, get_template_mock):
+        """
+        Test reverse function of the migration on modified templates with the same length
+
+        :param get_template_mock: the get_template function mock
+        """
+        MailTemplate.objects.create(event=self.event, text="Template source",
+                                    html="Template SOURCE", subject="Template source")
+
+        fill_mailtemplate.reverse_code(apps)
+        self.event.refresh_from_db()
+
+        self.assert_get_template_has_calls(get_template_mock)
+        self.assertTrue(self.event.has_mailtemplate)
+
     def test_reverse_code_modified(self, get_template_mock):
         """
         Test reverse function of the migration on modified templates
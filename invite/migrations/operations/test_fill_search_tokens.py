@@ -0,0 +1,26 @@
+"""
+test_fill_search_tokens
+"""
+from unittest import TestCase
+
+from django.apps import apps
+
+from invite.models import FamilySearchToken
+from . import fill_search_tokens
+from ...tests.common import TestFamilyMixin
+
+
+class TestCode(TestFamilyMixin, TestCase):
+    """
+    Test fill_search_tokens migration operations
+    """
+    def test_code(self):
+        """
+        Test the migration code recreate the missing tokens
+        """
+        FamilySearchToken.objects.all().delete()
+
+        fill_search_tokens.code(apps)
+
+        self.assertSetEqual(set(self.family.search_tokens.values_list("token", flat=True)),
+                            {"francoise", "jean", "michel", "michelle"})
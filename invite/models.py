@@ -3,19 +3,68 @@ Data models configurations of django-invite project
 
 Created by lmarvaud on 03/11/2018
 """
+import json
+from collections import OrderedDict
+from itertools import chain, islice
+
 from django.conf import settings
-from django.db import models
-from django.db.models import Sum
-from django.template import Template
-from django.template.context import make_context
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import translation
 from django.utils.functional import cached_property
 from django.utils.translation import gettext as _
 
+from .addresses import format_addresses
+from .hosts import get_host_directory
 from .join_and import join_and
+from .lazy_context import LazyContext
+from .render import activate_languages, render_pool, render_template
+from .search import TOKEN_MAX_LENGTH, prefix_range, refresh_tokens, tokenize
 
 __all__ = ["Family", "Guest", "Accompany"]
 
 
+def _accompanies(context):
+    """Join the accompany names of the context family, if it has any"""
+    return join_and(context["family"].accompany_names()) if context["accompanies_count"] else ""
+
+
+# The context family can be a Family or any object with the same data methods, like the
+# invite.records.FamilyRecord
+FAMILY_CONTEXT_FACTORIES = {
+    "all": lambda context: join_and(chain(context["family"].guest_names(),
+                                          context["family"].accompany_names())),
+    "count": lambda context: context["guests_count"] + context["accompanies_count"],
+    "accompanies": _accompanies,
+    "accompanies_e": lambda context: "e" if context["accompanies_are_female"] else "",
+    "accompanies_count": lambda context: context["family"].accompanies_number(),
+    "e": lambda context: "e" if context["is_female"] else "",
+    "guests": lambda context: join_and(context["family"].guest_names()),
+    "guests_count": lambda context: context["family"].guests_number(),
+    "has_accompanies": lambda context: context["accompanies_count"] > 1,
+    "has_accompany": lambda context: context["accompanies_count"] >= 1,
+    "is_female": lambda context: context["family"].guests_are_female(),
+    "accompanies_are_female": lambda context: context["family"].accompanies_are_female(),
+}
+
+
+class FamilyQuerySet(models.QuerySet):
+    """Family queryset"""
+    def invite(self, event, batch_size=500):
+        """
+        Invite the families to an event
+
+        :param event: the event to invite the families to
+        :param batch_size: the number of families linked per query
+        :return: the number of newly invited families
+        """
+        return event.invite(self.values_list("pk", flat=True).iterator(chunk_size=batch_size),
+                            batch_size)
+
+
 class Family(models.Model):
     """
     Representation of a group of linked person
@@ -26,45 +75,53 @@ class Family(models.Model):
     In the current version the family can be invited distinctly to 3 parts of the event according to
     those boolean : invited_midday, invited_afternoon and invited_evening
     """
-    objects = models.Manager()
+    objects = FamilyQuerySet.as_manager()
 
     invited_midday = models.BooleanField(verbose_name=_("is invite on lunch"), default=False)
     invited_afternoon = models.BooleanField(verbose_name=_("is invite the afternoon"),
                                             default=False)
     invited_evening = models.BooleanField(verbose_name=_("is invite at the party"), default=True)
     host = models.CharField(verbose_name=_("principal host"), max_length=32)
+    language = models.CharField(verbose_name=_("language"), max_length=15, blank=True,
+                                help_text=_("code of one of the LANGUAGES setting, empty for the "
+                                            "default language"))
 
     @cached_property
     def context(self):
         """
-        Create a template context for french language
-        """
-        guests_count = self.guests.count()
-        is_female = not self.guests.exclude(female=True).exists()
-        accomanies_are_females = not self.accompanies.exclude(female=True).exists()
-        guests = join_and(list(self.guests.values_list("name", flat=True)))
-        accompanies = join_and(list(self.accompanies.values_list("name", flat=True)))
-        accompanies_count = self.accompanies.aggregate(Sum("number"))
-        accompanies_count = accompanies_count["number__sum"] or 0
-        has_accompany = accompanies_count >= 1
-        has_accompanies = accompanies_count > 1
-        context = {
-            "family": self,
-            "all": join_and(list(self.guests.values_list("name", flat=True)) +
-                            list(self.accompanies.values_list("name", flat=True))),
-            "count": guests_count + accompanies_count,
-            "accompanies": accompanies if accompanies_count else "",
-            "accompanies_e": "e" if accomanies_are_females else "",
-            "accompanies_count": accompanies_count,
-            "e": ("e" if is_female else ""),
-            "guests": guests,
-            "guests_count": guests_count,
-            "has_accompanies": has_accompanies,
-            "has_accompany": has_accompany,
-            "is_female": is_female,
-            "accompanies_are_female": accomanies_are_females,
-        }
-        return context
+        Create a lazy template context for french language
+
+        Each value is only computed (and queried) on its first access
+        """
+        return LazyContext(FAMILY_CONTEXT_FACTORIES, {"family": self})
+
+    def guest_names(self):
+        """Query the guest names"""
+        return self.guests.values_list("name", flat=True)
+
+    def accompany_names(self):
+        """Query the accompany names"""
+        return self.accompanies.values_list("name", flat=True)
+
+    def guests_number(self):
+        """Count the guests"""
+        return self.guests.count()
+
+    def accompanies_number(self):
+        """Count the accompanies, using their number"""
+        return self.accompanies.aggregate(Sum("number"))["number__sum"] or 0
+
+    def guests_are_female(self):
+        """Determine wether all the guests are female"""
+        return not self.guests.exclude(female=True).exists()
+
+    def accompanies_are_female(self):
+        """Determine wether all the accompanies are female"""
+        return not self.accompanies.exclude(female=True).exists()
+
+    def guest_addresses(self):
+        """Generate the guests email addresses, each email once"""
+        return format_addresses(self.guests.values_list("name", "email"))
 
     def __str__(self):
         return str(_("%(all)s family") % {"all": self.context['all']})
@@ -80,7 +137,7 @@ class Family(models.Model):
 
         if format_spec not in self.context:
             raise ValueError("Invalid format specifier")
-        return ('{%s}' % format_spec).format(**self.context)
+        return ('{%s}' % format_spec).format_map(self.context)
 
     class Meta:
         verbose_name = _("family")
@@ -105,6 +162,10 @@ class Guest(models.Model):
 
     class Meta:
         verbose_name = _("Guest")
+        indexes = [
+            models.Index(fields=["family", "female"], name="invite_guest_family_female"),
+            models.Index(fields=["email"], name="invite_guest_email"),
+        ]
 
 
 class Accompany(models.Model):
@@ -124,6 +185,75 @@ class Accompany(models.Model):
 
     class Meta:
         verbose_name = _("accompany")
+        indexes = [
+            models.Index(fields=["family", "female"], name="invite_accompany_family_female"),
+        ]
+
+
+class FamilySearchTokenManager(models.Manager):
+    """FamilySearchToken manager"""
+    def refresh(self, family_ids):
+        """Synchronize the families search tokens with their guests and accompanies names"""
+        refresh_tokens(self.model, Guest, Accompany, family_ids)
+
+    def search(self, search_term):
+        """
+        Search the families having names starting with each word of the search term
+
+        :param search_term: the searched text
+        :return: the queryset of the matching family ids (None without any word)
+        """
+        family_ids = None
+        for term in tokenize(search_term):
+            matching = self.filter(token__range=prefix_range(term)).values("family_id")
+            family_ids = matching if family_ids is None else \
+                family_ids.filter(family_id__in=matching)
+        return family_ids
+
+
+class FamilySearchToken(models.Model):
+    """
+    Normalized word of one of the family guests or accompanies names
+
+    Denormalized from the guests and accompanies to search the families without joins
+    """
+    objects = FamilySearchTokenManager()
+
+    family = models.ForeignKey(Family, models.CASCADE, "search_tokens", verbose_name=_("family"))
+    token = models.CharField(verbose_name=_("token"), max_length=TOKEN_MAX_LENGTH, db_index=True)
+
+    def __str__(self):
+        return self.token
+
+    class Meta:
+        verbose_name = _("search token")
+        unique_together = (("family", "token"),)
+
+
+def _merge_mass_emails(mass_emails):
+    """Merge the mass mail tuples of one family in one mass mail tuple"""
+    subjects, texts, htmls, from_emails, recipients = zip(*mass_emails)
+    return (
+        join_and(list(OrderedDict.fromkeys(subjects))),
+        "\n\n".join(texts),
+        "\n<hr>\n".join(htmls),
+        from_emails[0],
+        list(recipients[0]),
+    )
+
+
+HEADCOUNT_CACHE_KEY = "invite.event.%d.headcount"
+HEADCOUNT_SECTIONS = ("midday", "afternoon", "evening")
+
+
+def _family_aggregate(model_class, aggregate):
+    """Subquery aggregating the members of the outer family"""
+    return Subquery(
+        model_class.objects.filter(family=OuterRef("pk")).order_by().values("family")
+        .annotate(value=aggregate).values("value"),
+        output_field=IntegerField()
+    )
+
 
 class Event(models.Model):
     """
@@ -138,14 +268,178 @@ class Event(models.Model):
     def context(self, family):
         """
         Create a template context
+
+        The event is layered on top of the family context without altering it, so a family can be
+        rendered for several events. When the event is frozen, the family snapshot is used.
         """
-        context = family.context
-        context.update({
-            "event": self
-        })
-        return context
+        if self.is_frozen:
+            snapshot = self.snapshots.filter(family_id=family.pk).values_list("context", flat=True) \
+                .first()
+            if snapshot is not None:
+                return self._load_context(json.loads(snapshot), self)
+        return self._live_context(family)
+
+    def _live_context(self, family):
+        """Create a template context from the family data"""
+        return LazyContext({}, {"event": self}, parent=family.context)
+
+    def family_contexts(self, families, batch_size=500):
+        """
+        Generate the template context of each family
+
+        When the event is frozen, the families snapshots are read with one query per batch.
 
-    def gen_mass_email(self, family, request=None):
+        :param families: the families to create the context of
+        :param batch_size: the number of snapshots read per query
+        :return: a generator of (family, context) tuples
+        """
+        if not self.is_frozen:
+            for family in families:
+                yield family, self._live_context(family)
+            return
+        families = iter(families)
+        batch = list(islice(families, batch_size))
+        while batch:
+            snapshots = dict(self.snapshots.filter(family_id__in=[family.pk for family in batch])
+                             .values_list("family_id", "context"))
+            for family in batch:
+                snapshot = snapshots.get(family.pk)
+                if snapshot is None:
+                    yield family, self._live_context(family)
+                else:
+                    yield family, self._load_context(json.loads(snapshot), self)
+            batch = list(islice(families, batch_size))
+
+    @cached_property
+    def is_frozen(self) -> bool:
+        """Determine wether the families contexts of the event have been snapshot"""
+        return self.pk is not None and self.snapshots.exists()
+
+    def freeze(self, batch_size=500):
+        """
+        Snapshot the context of every invited family, to render the next mails from it
+
+        :param batch_size: the number of snapshots created per query
+        :return: the number of snapshots
+        """
+        count = 0
+        with transaction.atomic():
+            self.snapshots.all().delete()
+            # each snapshot is created while its family language is active
+            snapshots = (
+                FamilyContextSnapshot(event=self, family=family, context=json.dumps(
+                    self._plain_context(self._live_context(family)), cls=DjangoJSONEncoder
+                ))
+                for family in activate_languages(
+                    self.families.order_by("language", "pk").iterator())
+            )
+            batch = list(islice(snapshots, batch_size))
+            while batch:
+                FamilyContextSnapshot.objects.bulk_create(batch)
+                count += len(batch)
+                batch = list(islice(snapshots, batch_size))
+        self.is_frozen = count > 0
+        return count
+
+    def unfreeze(self):
+        """Invalidate the families contexts snapshots : the mails are rendered from live data"""
+        self.snapshots.all().delete()
+        self.is_frozen = False
+
+    def invite(self, family_ids, batch_size=500):
+        """
+        Invite families to the event, with bulk inserts of the missing invitations
+
+        :param family_ids: the ids of the families to invite
+        :param batch_size: the number of families linked per query
+        :return: the number of newly invited families
+        """
+        through_class = Event.families.through
+        family_ids = iter(family_ids)
+        invited = 0
+        batch = list(islice(family_ids, batch_size))
+        while batch:
+            existing = set(through_class.objects.filter(event=self, family_id__in=batch)
+                           .values_list("family_id", flat=True))
+            created = through_class.objects.bulk_create(
+                through_class(event=self, family_id=family_id)
+                for family_id in OrderedDict.fromkeys(batch) if family_id not in existing
+            )
+            invited += len(created)
+            batch = list(islice(family_ids, batch_size))
+        if invited:
+            Event.invalidate_headcounts([self.pk])
+        return invited
+
+    def headcount(self):
+        """
+        Count the invited families, guests and accompanies, in total and by section
+
+        The counts are computed with a single grouped query, then cached until the event families,
+        guests or accompanies change, or for INVITE_HEADCOUNT_TIMEOUT seconds (an hour by default).
+
+        :return: a dict of the "total", "midday", "afternoon" and "evening" counts, each a dict
+        of the families, guests, female_guests, male_guests, accompanies, female_accompanies and
+        male_accompanies counts
+        """
+        cache_key = HEADCOUNT_CACHE_KEY % self.pk
+        headcount = cache.get(cache_key)
+        if headcount is None:
+            headcount = self._compute_headcount()
+            cache.set(cache_key, headcount, getattr(settings, "INVITE_HEADCOUNT_TIMEOUT", 3600))
+        return headcount
+
+    def _compute_headcount(self):
+        """Count the invited people of the event, grouped by their sections"""
+        counts_keys = ("families", "guests", "female_guests", "male_guests", "accompanies",
+                       "female_accompanies", "male_accompanies")
+        headcount = {section: dict.fromkeys(counts_keys, 0)
+                     for section in ("total",) + HEADCOUNT_SECTIONS}
+        groups = self.families.order_by().annotate(
+            family_guests=_family_aggregate(Guest, Count("pk")),
+            family_female_guests=_family_aggregate(Guest, Count("pk", filter=Q(female=True))),
+            family_accompanies=_family_aggregate(Accompany, Sum("number")),
+            family_female_accompanies=_family_aggregate(Accompany,
+                                                        Sum("number", filter=Q(female=True))),
+        ).values("invited_midday", "invited_afternoon", "invited_evening").annotate(
+            families=Count("pk"),
+            guests=Coalesce(Sum("family_guests"), 0),
+            female_guests=Coalesce(Sum("family_female_guests"), 0),
+            accompanies=Coalesce(Sum("family_accompanies"), 0),
+            female_accompanies=Coalesce(Sum("family_female_accompanies"), 0),
+        )
+        for group in groups:
+            group["male_guests"] = group["guests"] - group["female_guests"]
+            group["male_accompanies"] = group["accompanies"] - group["female_accompanies"]
+            sections = ("total",) + tuple(section for section in HEADCOUNT_SECTIONS
+                                          if group["invited_" + section])
+            for section in sections:
+                for key in counts_keys:
+                    headcount[section][key] += group[key]
+        return headcount
+
+    @staticmethod
+    def invalidate_headcounts(event_ids):
+        """
+        Forget the cached headcount of the events, once the current transaction is committed
+
+        A headcount computed by a concurrent request before the commit would be cached stale.
+        """
+        keys = [HEADCOUNT_CACHE_KEY % event_id for event_id in event_ids]
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+    @staticmethod
+    def invalidate_families_headcounts(family_ids, batch_size=500):
+        """Forget the cached headcount of the events inviting the families"""
+        family_ids = list(family_ids)
+        for start in range(0, len(family_ids), batch_size):
+            Event.invalidate_headcounts(
+                Event.families.through.objects
+                .filter(family_id__in=family_ids[start:start + batch_size])
+                .values_list("event_id", flat=True).distinct()
+            )
+
+    def gen_mass_email(self, family, request=None, context=None):
         """
         Generate the mass mail tuple for one email
 
@@ -153,26 +447,128 @@ class Event(models.Model):
 
         :param family: the family to send the event message to
         :param request: the request which initiated the generation
+        :param context: the family template context, if already created
         :return: a tuple with the subject, the text message, the html message and the destinations
         email
         """
-        context = self.context(family)
+        if context is None:
+            context = self.context(family)
         assert self.has_mailtemplate, "The event has no email template set"
         return (
             self.mailtemplate.render_subject(context=context, request=request),  # pylint: disable=no-member
             self.mailtemplate.render_text(context=context, request=request),  # pylint: disable=no-member
             self.mailtemplate.render_html(context=context, request=request),  # pylint: disable=no-member
-            "{} <{}>".format(family.host, settings.INVITE_HOSTS[family.host])
-            if (getattr(settings, "INVITE_USE_HOST_IN_FROM_EMAIL", False) and
-                family.host in settings.INVITE_HOSTS)
-            else None,
-            (
-                "{} <{}>".format(*values)
-                for values in family.guests.values_list("name", "email")
-                if all(values)
-            )
+            self._from_email(family),
+            self._recipients(family),
         )
 
+    def gen_mass_emails(self, families, request=None, processes=None):
+        """
+        Generate the mass mail tuples for several families
+
+        Each family mail is rendered in the family language : order the families by language so
+        each language is only activated once. With more than one process, the families contexts
+        are preloaded as plain data and the templates are rendered in a pool of processes. The
+        request is then not used to render.
+
+        :param families: the families to send the event message to
+        :param request: the request which initiated the generation
+        :param processes: the number of render processes, default to the
+        INVITE_RENDER_PROCESSES setting (1 : render in the current process)
+        :return: a generator of mass mail tuples (see gen_mass_email)
+        """
+        if processes is None:
+            processes = getattr(settings, "INVITE_RENDER_PROCESSES", 1)
+        # activate the languages around the contexts : the snapshots are read batch by batch
+        contexts = activate_languages(self.family_contexts(families),
+                                      key=lambda family_context: family_context[0].language)
+        if processes <= 1:
+            return (self.gen_mass_email(family, request=request, context=context)
+                    for family, context in contexts)
+        assert self.has_mailtemplate, "The event has no email template set"
+        mailtemplate = self.mailtemplate  # pylint: disable=no-member
+        templates = (mailtemplate.subject, mailtemplate.text, mailtemplate.html)
+        return render_pool(templates, (self._render_data(family, context)
+                                       for family, context in contexts), processes)
+
+    @staticmethod
+    def gen_events_mass_emails(events, request=None, merge=False):
+        """
+        Generate the mass mail tuples of several events, family by family
+
+        Each family is loaded once, as a FamilyRecord, and its context is built once for all the
+        selected events it is invited to. The families are grouped by language.
+
+        :param events: the events to send the messages of
+        :param request: the request which initiated the generation
+        :param merge: merge the messages of each family in one message
+        :return: a generator of mass mail tuples (see gen_mass_email)
+        """
+        events = {event.pk: event for event in events}
+        invitations = Event.families.through.objects.filter(event_id__in=list(events))
+        family_events = {}
+        for family_id, event_id in invitations.order_by("family_id", "event_id") \
+                .values_list("family_id", "event_id"):
+            family_events.setdefault(family_id, []).append(events[event_id])
+        from .records import load_family_records  # pylint: disable=cyclic-import
+        families = Family.objects.filter(pk__in=invitations.values("family_id")) \
+            .order_by("language", "pk")
+        for family in activate_languages(load_family_records(families)):
+            mass_emails = [event.gen_mass_email(family, request=request)
+                           for event in family_events[family.pk]]
+            if merge and len(mass_emails) > 1:
+                yield _merge_mass_emails(mass_emails)
+            else:
+                yield from mass_emails
+
+    def _render_data(self, family, context):
+        """
+        Preload the plain and picklable data to render the family mail in another process
+
+        :return: a tuple with the context dict, the from email, the recipients list and the
+        language
+        """
+        event = Event(pk=self.pk, name=self.name, date=self.date)
+        return (self._load_context(self._plain_context(context), event),
+                self._from_email(family), list(self._recipients(family)),
+                translation.get_language())
+
+    @staticmethod
+    def _plain_context(context):
+        """
+        Dump a template context in plain data (json serializable), without the event
+
+        The family is dumped as a dict of its fields
+        """
+        plain = {key: value for key, value in context.items() if key not in ("family", "event")}
+        family = context["family"]
+        fields = Family._meta.concrete_fields  # pylint: disable=no-member,protected-access
+        plain["family"] = {field.attname: getattr(family, field.attname) for field in fields}
+        return plain
+
+    @staticmethod
+    def _load_context(plain, event):
+        """
+        Load a template context dumped with _plain_context
+
+        The family is a detached copy whose context is the loaded context
+        """
+        context = dict(plain)
+        context["family"] = Family(**plain["family"])
+        context["family"].context = context
+        context["event"] = event
+        return context
+
+    @staticmethod
+    def _from_email(family):
+        """The host from email of the family if INVITE_USE_HOST_IN_FROM_EMAIL is set"""
+        return get_host_directory().from_email(family.host)
+
+    @staticmethod
+    def _recipients(family):
+        """Generate the family guests addresses"""
+        return family.guest_addresses()
+
     @property
     def has_mailtemplate(self) -> bool:
         """Determine wether the event has a mail template set or not yet"""
@@ -198,6 +594,26 @@ class Event(models.Model):
         verbose_name_plural = _("events")
 
 
+class FamilyContextSnapshot(models.Model):
+    """
+    Frozen template context of a family for an event
+
+    see Event.freeze
+    """
+    objects = models.Manager()
+
+    event = models.ForeignKey(Event, models.CASCADE, "snapshots", verbose_name=_("event"))
+    family = models.ForeignKey(Family, models.CASCADE, "snapshots", verbose_name=_("family"))
+    context = models.TextField(_("json context"))
+
+    def __str__(self):
+        return "{family_id}@{event_id}".format(family_id=self.family_id, event_id=self.event_id)
+
+    class Meta:
+        verbose_name = _("family context snapshot")
+        unique_together = (("event", "family"),)
+
+
 class MailTemplate(models.Model):
     """Event mail template"""
     objects = models.Manager()
@@ -210,8 +626,7 @@ class MailTemplate(models.Model):
     @staticmethod
     def _render(template_string, context, request):
         """Render a template string"""
-        context = make_context(context, request, autoescape=True)
-        return Template(template_string).render(context)
+        return render_template(template_string, context, request)
 
     def render_subject(self, context, request):
         """Render the subject"""
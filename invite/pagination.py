@@ -0,0 +1,115 @@
+"""
+pagination
+
+Admin changelists paginated by primary key ranges (keyset pagination) with estimated counts, so
+the deep pages of large tables cost the same as the first one
+"""
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+AFTER_VAR = "after"
+
+
+def estimated_count(queryset):
+    """
+    Count the rows of a queryset, using the table statistics when the database has them
+
+    Only the unfiltered querysets of a PostgreSQL table are estimated (from pg_class.reltuples) :
+    the others, and the tables never analyzed, are counted exactly.
+
+    :param queryset: the queryset to count
+    :return: a tuple of the count and wether it is an estimation
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql" and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                           [queryset.model._meta.db_table])  # pylint: disable=protected-access
+            row = cursor.fetchone()
+        if row and row[0] > 0:
+            return row[0], True
+    return queryset.count(), False
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator counting its objects with estimated_count"""
+    estimated = False
+
+    @cached_property
+    def count(self):
+        """Estimate the number of objects"""
+        count, self.estimated = estimated_count(self.object_list)
+        return count
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Change list paginated by primary key ranges when it is ordered by primary key
+
+    The next page is the list_per_page objects after the last primary key of the current page, so
+    no OFFSET is used. The other orderings keep the page numbers pagination.
+    """
+    keyset = False
+    first_page_url = None
+    next_page_url = None
+
+    def get_filters_params(self, params=None):
+        """Do not filter on the keyset parameter"""
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(AFTER_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        """Restart the keyset pagination when the filters or the ordering change"""
+        if AFTER_VAR not in (new_params or {}):
+            remove = list(remove or []) + [AFTER_VAR]
+        return super().get_query_string(new_params, remove)
+
+    def get_results(self, request):
+        """Get the page of objects after the requested primary key"""
+        ordering = list(self.queryset.query.order_by)
+        pk_names = ("pk", self.lookup_opts.pk.name)
+        if self.show_all or len(ordering) != 1 or ordering[0].lstrip("-") not in pk_names:
+            super().get_results(request)
+            return
+        lookup = "pk__lt" if ordering[0].startswith("-") else "pk__gt"
+        queryset = self.queryset
+        after = self.params.get(AFTER_VAR)
+        try:
+            if after:
+                queryset = queryset.filter(**{lookup: after})
+            result_list = queryset[:self.list_per_page]
+            pks = [obj.pk for obj in result_list]
+        except (ValueError, TypeError):
+            raise IncorrectLookupParameters
+        has_next = len(pks) == self.list_per_page and \
+            queryset.filter(**{lookup: pks[-1]}).exists()
+
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.result_count = paginator.count
+        self.show_full_result_count = self.model_admin.show_full_result_count
+        self.full_result_count = estimated_count(self.root_queryset)[0] \
+            if self.show_full_result_count else None
+        self.show_admin_actions = not self.show_full_result_count or bool(self.full_result_count)
+        self.result_list = result_list
+        self.can_show_all = False
+        self.multi_page = bool(after) or has_next
+        self.paginator = paginator
+        self.keyset = True
+        if after:
+            self.first_page_url = self.get_query_string()
+        if has_next:
+            self.next_page_url = self.get_query_string({AFTER_VAR: pks[-1]})
+
+
+class KeysetPaginationMixin:
+    """Model admin mixin paginating its changelist by primary key ranges, with estimated counts"""
+    paginator = EstimatedCountPaginator
+    change_list_template = "admin/invite/keyset_change_list.html"
+
+    def get_changelist(self, request, **kwargs):
+        """Use the keyset paginated change list"""
+        return KeysetChangeList
@@ -0,0 +1,93 @@
+"""
+purge
+
+Bulk deletion of families and events, without the deletion collector loading their related rows
+
+The related rows are deleted first, table by table, with one DELETE statement per batch. The
+deletion signals of each row are not sent : the purged signal summarizes the whole purge instead.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.dispatch import Signal
+
+from .models import Accompany, Event, Family, FamilyContextSnapshot, FamilySearchToken, Guest, \
+    MailTemplate
+
+# Sent after a purge with the purged model as sender, the purged primary keys and the number of
+# deleted rows per model label
+purged = Signal(providing_args=["ids", "counts"])  # pylint: disable=invalid-name
+
+FAMILY_DEPENDENTS = (
+    (FamilySearchToken, "family_id"),
+    (FamilyContextSnapshot, "family_id"),
+    (Event.families.through, "family_id"),
+    (Guest, "family_id"),
+    (Accompany, "family_id"),
+)
+EVENT_DEPENDENTS = (
+    (FamilyContextSnapshot, "event_id"),
+    (Event.families.through, "event_id"),
+    (MailTemplate, "event_id"),
+)
+
+
+def _raw_delete(queryset):
+    """Delete the queryset rows with a single DELETE statement, without loading them"""
+    return queryset._raw_delete(queryset.db)  # pylint: disable=protected-access
+
+
+def _label(model_class):
+    """The model label, like invite.Family"""
+    return model_class._meta.label  # pylint: disable=protected-access
+
+
+def _purge(model_class, dependents, ids, batch_size, before_batch=None):
+    """
+    Delete the rows of a model and their dependents, batch by batch
+
+    :param model_class: the purged model
+    :param dependents: the (model, foreign key attname) of the rows depending on the purged ones
+    :param ids: the primary keys of the rows to delete
+    :param batch_size: the number of rows purged per transaction
+    :param before_batch: a function called with each batch of ids before its deletion
+    :return: the number of deleted rows per model label
+    """
+    ids = list(ids)
+    counts = Counter()
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        with transaction.atomic():
+            if before_batch is not None:
+                before_batch(batch)
+            for dependent_class, attname in dependents:
+                counts[_label(dependent_class)] += _raw_delete(
+                    dependent_class.objects.filter(**{attname + "__in": batch})
+                )
+            counts[_label(model_class)] += _raw_delete(model_class.objects.filter(pk__in=batch))
+    purged.send(sender=model_class, ids=ids, counts=counts)
+    return counts
+
+
+def purge_families(families, batch_size=500):
+    """
+    Delete families with their guests, accompanies, invitations, search tokens and snapshots
+
+    :param families: the Family queryset to delete
+    :param batch_size: the number of families deleted per transaction
+    :return: the number of deleted rows per model label
+    """
+    return _purge(Family, FAMILY_DEPENDENTS, families.values_list("pk", flat=True).iterator(),
+                  batch_size, Event.invalidate_families_headcounts)
+
+
+def purge_events(events, batch_size=500):
+    """
+    Delete events with their invitations, mail templates and snapshots (the families are kept)
+
+    :param events: the Event queryset to delete
+    :param batch_size: the number of events deleted per transaction
+    :return: the number of deleted rows per model label
+    """
+    return _purge(Event, EVENT_DEPENDENTS, events.values_list("pk", flat=True).iterator(),
+                  batch_size, Event.invalidate_headcounts)
@@ -0,0 +1,126 @@
+"""
+records
+
+Memory compact, read only, families records for the bulk operations
+
+A FamilyRecord has the Family fields and data methods used by the template contexts and the mail
+generation, without the model instances overhead (state, fields cache and __dict__)
+"""
+from collections import namedtuple
+from itertools import islice
+
+from django.utils.translation import gettext as _
+
+from .addresses import format_addresses
+from .lazy_context import LazyContext
+from .models import FAMILY_CONTEXT_FACTORIES, Guest, Accompany
+
+FAMILY_FIELDS = ("id", "invited_midday", "invited_afternoon", "invited_evening", "host",
+                 "language")
+
+GuestRecord = namedtuple("GuestRecord", ("name", "email", "phone", "female"))
+AccompanyRecord = namedtuple("AccompanyRecord", ("name", "number", "female"))
+
+
+class RecordList(list):
+    """
+    List of guests or accompanies records, with the manager methods used by the templates
+
+    So ``family.guests.all`` and ``family.guests.count`` render the same from a record as from a
+    Family.
+    """
+    def all(self):
+        """All the records"""
+        return self
+
+    def count(self, *value):
+        """Count the records (or the occurrences of a value, like a list)"""
+        return super().count(*value) if value else len(self)
+
+    def exists(self):
+        """Determine wether there is any record"""
+        return bool(self)
+
+
+class FamilyRecord:
+    """Family record with its guests and accompanies records"""
+    __slots__ = FAMILY_FIELDS + ("guests", "accompanies", "_context")
+
+    def __init__(self, pk, invited_midday, invited_afternoon, invited_evening,  # pylint: disable=invalid-name,too-many-arguments
+                 host, language=""):
+        self.id = pk  # pylint: disable=invalid-name
+        self.invited_midday = invited_midday
+        self.invited_afternoon = invited_afternoon
+        self.invited_evening = invited_evening
+        self.host = host
+        self.language = language
+        self.guests = RecordList()
+        self.accompanies = RecordList()
+        self._context = None
+
+    @property
+    def pk(self):  # pylint: disable=invalid-name
+        """The family primary key"""
+        return self.id
+
+    @property
+    def context(self):
+        """Create a lazy template context, computed from the records"""
+        if self._context is None:
+            self._context = LazyContext(FAMILY_CONTEXT_FACTORIES, {"family": self})
+        return self._context
+
+    def guest_names(self):
+        """List the guest names"""
+        return [guest.name for guest in self.guests]
+
+    def accompany_names(self):
+        """List the accompany names"""
+        return [accompany.name for accompany in self.accompanies]
+
+    def guests_number(self):
+        """Count the guests"""
+        return len(self.guests)
+
+    def accompanies_number(self):
+        """Count the accompanies, using their number"""
+        return sum(accompany.number for accompany in self.accompanies)
+
+    def guests_are_female(self):
+        """Determine wether all the guests are female"""
+        return all(guest.female for guest in self.guests)
+
+    def accompanies_are_female(self):
+        """Determine wether all the accompanies are female"""
+        return all(accompany.female for accompany in self.accompanies)
+
+    def guest_addresses(self):
+        """Generate the guests email addresses, each email once"""
+        return format_addresses((guest.name, guest.email) for guest in self.guests)
+
+    def __str__(self):
+        return str(_("%(all)s family") % {"all": self.context['all']})
+
+
+def load_family_records(families, chunk_size=500):
+    """
+    Load the families records, with their guests and accompanies, chunk by chunk
+
+    Each chunk is loaded with one query per table, so memory only hold one chunk of model data.
+
+    :param families: the Family queryset to load
+    :param chunk_size: the number of families loaded per chunk
+    :return: a generator of FamilyRecord
+    """
+    rows = families.values_list(*FAMILY_FIELDS).iterator(chunk_size=chunk_size)
+    chunk = list(islice(rows, chunk_size))
+    while chunk:
+        records = {row[0]: FamilyRecord(*row) for row in chunk}
+        for family_id, *guest in Guest.objects.filter(family_id__in=list(records)) \
+                .order_by("pk").values_list("family_id", *GuestRecord._fields):
+            records[family_id].guests.append(GuestRecord(*guest))
+        for family_id, *accompany in Accompany.objects.filter(family_id__in=list(records)) \
+                .order_by("pk").values_list("family_id", *AccompanyRecord._fields):
+            records[family_id].accompanies.append(AccompanyRecord(*accompany))
+        yield from (records[row[0]] for row in chunk)
+        chunk = list(islice(rows, chunk_size))
@@ -0,0 +1,118 @@
+"""
+render
+
+Mail templates rendering, optionally fanned out to a pool of processes
+"""
+from functools import lru_cache
+from itertools import islice
+from operator import attrgetter
+from multiprocessing import Pool
+
+import django
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template import Template
+from django.template.context import make_context
+from django.utils import translation
+
+_WORKER_TEMPLATES = ()
+
+
+@lru_cache(maxsize=128)
+def compile_template(template_string):
+    """Compile a template string once and keep it for the next renders"""
+    return Template(template_string)
+
+
+@receiver(setting_changed)
+def clear_compiled_templates(setting, **unused_kwargs):
+    """Clear the compiled templates cache when the templates settings changed"""
+    if setting == "TEMPLATES":
+        compile_template.cache_clear()
+
+
+def render_template(template_string, context, request=None):
+    """
+    Render a template string
+
+    :param template_string: the template source
+    :param context: the context mapping, kept as is (a lazy context is not computed entirely)
+    :param request: the request which initiated the rendering
+    :return: the rendered string
+    """
+    template_context = make_context(None, request, autoescape=True)
+    # Append the context as is : make_context would copy it into a dict, computing every value
+    template_context.dicts.append(context)
+    # and a writable dict above it, for the "as variable" tags
+    template_context.push()
+    return compile_template(template_string).render(template_context)
+
+
+def activate_languages(families, key=attrgetter("language")):
+    """
+    Generate the families, each one while its language is active
+
+    A language is only activated when it differs from the previous family one, so the families
+    should be ordered by language. The families without language use the language active at the
+    start, which is activated again at the end.
+
+    :param families: the families (or records) to generate
+    :param key: the function returning the language of a family
+    :return: a generator of the families
+    """
+    default = translation.get_language()
+    current = default
+    try:
+        for family in families:
+            language = key(family) or default
+            if language != current:
+                translation.activate(language)
+                current = language
+            yield family
+    finally:
+        if current != default:
+            translation.activate(default)
+
+
+def _init_worker(templates):
+    """Initialize a render worker process with the subject, text and html templates"""
+    global _WORKER_TEMPLATES  # pylint: disable=global-statement
+    django.setup()
+    _WORKER_TEMPLATES = templates
+
+
+def _render_worker(data):
+    """Render one mass mail tuple from the plain (context, from_email, recipients, language)
+    data"""
+    context, from_email, recipients, language = data
+    if language != translation.get_language():
+        translation.activate(language)
+    subject, text, html = (render_template(template, context) for template in _WORKER_TEMPLATES)
+    return subject, text, html, from_email, recipients
+
+
+def render_pool(templates, datas, processes, chunksize=64):
+    """
+    Render the mass mail tuples in a pool of processes
+
+    The datas are consumed by batches in the current process (they may query the database) while
+    the previous batch is rendered by the workers.
+
+    :param templates: the subject, text and html template strings
+    :param datas: iterable of picklable (context, from_email, recipients, language) tuples
+    :param processes: the number of worker processes
+    :param chunksize: the number of messages sent at once to a worker
+    :return: generator of (subject, text, html, from_email, recipients) tuples
+    """
+    datas = iter(datas)
+    with Pool(processes, _init_worker, (tuple(templates),)) as pool:
+        pending = None
+        batch = list(islice(datas, chunksize * processes))
+        while batch:
+            result = pool.map_async(_render_worker, batch, chunksize)
+            if pending is not None:
+                yield from pending.get()
+            pending = result
+            batch = list(islice(datas, chunksize * processes))
+        if pending is not None:
+            yield from pending.get()
@@ -0,0 +1,74 @@
+"""
+search
+
+Normalized name tokens used to search the families by their guests and accompanies names
+"""
+import re
+import unicodedata
+
+TOKEN_MAX_LENGTH = 64
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """
+    Split a text in normalized tokens : lower case words without accents
+
+    for example,
+    ```
+    tokenize("Françoise & Jean-Pierre")
+    ```
+    would return : ["francoise", "jean", "pierre"]
+    """
+    normalized = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode()
+    return [token[:TOKEN_MAX_LENGTH] for token in _WORD.findall(normalized.lower())]
+
+
+def names_tokens(names):
+    """The set of tokens of an iterable of names"""
+    return {token for name in names for token in tokenize(name)}
+
+
+def prefix_range(term):
+    """
+    The (lower, upper) bounds of the tokens starting with a term
+
+    A range lookup is used instead of a LIKE so the database can use the token index.
+    """
+    return term, term + "\uffff"
+
+
+def refresh_tokens(token_class, guest_class, accompany_class, family_ids, batch_size=500):
+    """
+    Synchronize the families search tokens with their guests and accompanies names
+
+    Only the stale tokens are deleted and the missing ones created. The model classes are given
+    so the function can be used from the migrations.
+
+    :param token_class: the FamilySearchToken model class
+    :param guest_class: the Guest model class
+    :param accompany_class: the Accompany model class
+    :param family_ids: the ids of the families to refresh
+    :param batch_size: the number of families refreshed per query
+    """
+    family_ids = list(family_ids)
+    for start in range(0, len(family_ids), batch_size):
+        batch = family_ids[start:start + batch_size]
+        expected = {
+            (family_id, token)
+            for model_class in (guest_class, accompany_class)
+            for family_id, name in model_class.objects.filter(family_id__in=batch)
+            .values_list("family_id", "name")
+            for token in tokenize(name)
+        }
+        existing = set(token_class.objects.filter(family_id__in=batch)
+                       .values_list("family_id", "token"))
+        stale = {}
+        for family_id, token in existing - expected:
+            stale.setdefault(family_id, []).append(token)
+        for family_id, tokens in stale.items():
+            token_class.objects.filter(family_id=family_id, token__in=tokens).delete()
+        token_class.objects.bulk_create(
+            token_class(family_id=family_id, token=token)
+            for family_id, token in expected - existing
+        )
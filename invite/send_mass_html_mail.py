@@ -3,11 +3,32 @@ send_mass_html_mail
 
 https://stackoverflow.com/questions/7583801/send-mass-emails-with-emailmultialternatives/10215091#10215091
 """
+import asyncio
+from queue import Queue
+from threading import Thread
+
 from django.core.mail import get_connection, EmailMultiAlternatives
 
 
+def _create_message(datas, **extra_kwargs):
+    """Create the message from a (subject, text_content, html_content, from_email,
+    recipient_list) datatuple"""
+    subject, text, html, from_email, recipient = datas
+    message = EmailMultiAlternatives(subject, text, from_email, recipient, **extra_kwargs)
+    message.attach_alternative(html, 'text/html')
+    return message
+
+
+def _materialize(datas):
+    """
+    Read the recipients of a datatuple, which may be a lazy query of the guests, before handing
+    it to another thread : the query must run on the producer database connection and transaction
+    """
+    return tuple(datas[:4]) + (list(datas[4]),)
+
+
 def send_mass_html_mail(datatuple, fail_silently=False, user=None, password=None,
-                        connection=None, **extra_kwargs):
+                        connection=None, senders=0, queue_size=64, **extra_kwargs):
     """
     Given a datatuple of (subject, text_content, html_content, from_email,
     recipient_list), sends each message to each recipient list. Returns the
@@ -18,12 +39,155 @@ def send_mass_html_mail(datatuple, fail_silently=False, user=None, password=None
     If auth_user is None, the EMAIL_HOST_USER setting is used.
     If auth_password is None, the EMAIL_HOST_PASSWORD setting is used.
 
+    Each message is only built just before it is sent, and released after : the memory holds
+    the waiting datatuples, not the whole campaign messages.
+    Without senders, the messages are sent one by one over the connection while the datatuple is
+    consumed. With senders, the messages are sent by as many threads (each with its own
+    connection, unless a connection is given) : the datatuple generation waits when `queue_size`
+    datatuples are already waiting to be sent.
     """
+    if senders:
+        connections = [connection] if connection else [
+            get_connection(username=user, password=password, fail_silently=fail_silently)
+            for _ in range(senders)
+        ]
+        return _send_pipeline(datatuple, connections, queue_size, **extra_kwargs)
     connection = connection or get_connection(
         username=user, password=password, fail_silently=fail_silently)
-    messages = []
-    for subject, text, html, from_email, recipient in datatuple:
-        message = EmailMultiAlternatives(subject, text, from_email, recipient, **extra_kwargs)
-        message.attach_alternative(html, 'text/html')
-        messages.append(message)
-    return connection.send_messages(messages)
+    opened = connection.open()
+    try:
+        return sum(connection.send_messages([_create_message(datas, **extra_kwargs)]) or 0
+                   for datas in datatuple)
+    finally:
+        if opened:
+            connection.close()
+
+
+class _Sender:
+    """
+    Send the datatuples messages over one session, for the threads and the asynchronous tasks
+
+    On error, the next datatuples are still accepted but not sent, so the queue never blocks : the
+    error is raised once the session is closed.
+    """
+    def __init__(self, session, extra_kwargs):
+        self.session = session
+        self.extra_kwargs = extra_kwargs
+        self.sent = 0
+        self.error = None
+
+    def open(self):
+        """Open the session"""
+        try:
+            self.session.open()
+        except Exception as exception:  # pylint: disable=broad-except
+            self.error = exception
+
+    def send(self, datas):
+        """Build and send the message of one datatuple"""
+        if self.error is None:
+            try:
+                self.sent += self.session.send_messages(
+                    [_create_message(datas, **self.extra_kwargs)]) or 0
+            except Exception as exception:  # pylint: disable=broad-except
+                self.error = exception
+
+    def close(self):
+        """Close the session"""
+        self.session.close()
+
+    def result(self):
+        """Return the number of sent messages, or raise the sending error"""
+        if self.error is not None:
+            raise self.error
+        return self.sent
+
+
+def _send_pipeline(datatuple, connections, queue_size, **extra_kwargs):
+    """Send the datatuple messages through a bounded queue consumed by one thread per
+    connection"""
+    queue = Queue(maxsize=queue_size)
+
+    def send(sender):
+        """Send the queued datatuples, until None is received"""
+        sender.open()
+        datas = queue.get()
+        while datas is not None:
+            sender.send(datas)
+            datas = queue.get()
+        sender.close()
+
+    senders = [_Sender(session, extra_kwargs) for session in connections]
+    threads = [Thread(target=send, args=(sender,), daemon=True) for sender in senders]
+    for thread in threads:
+        thread.start()
+    try:
+        for datas in datatuple:
+            queue.put(_materialize(datas))
+    finally:
+        for _ in threads:
+            queue.put(None)
+        for thread in threads:
+            thread.join()
+    return sum(sender.result() for sender in senders)
+
+
+async def asend_mass_html_mail(datatuple, fail_silently=False, user=None, password=None,
+                               connection=None, sessions=4, **extra_kwargs):
+    """
+    Asynchronous send_mass_html_mail
+
+    The datatuple can be an iterable or an asynchronous iterable : it is consumed while the
+    previous messages are sent, so the rendering and the sending overlap.
+    The messages are sent over `sessions` concurrent connections (one if a connection is given),
+    each connection sending in the event loop default executor. Returns the number of emails sent.
+    When the datatuple generation raises, the messages already queued are sent before the error is
+    raised.
+    """
+    loop = asyncio.get_event_loop()
+    connections = [connection] if connection else [
+        get_connection(username=user, password=password, fail_silently=fail_silently)
+        for _ in range(sessions)
+    ]
+    queue = asyncio.Queue(maxsize=2 * len(connections))
+
+    async def send(sender):
+        """Send the queued datatuples, until None is received"""
+        await loop.run_in_executor(None, sender.open)
+        try:
+            datas = await queue.get()
+            while datas is not None:
+                await loop.run_in_executor(None, sender.send, datas)
+                datas = await queue.get()
+        finally:
+            await loop.run_in_executor(None, sender.close)
+
+    senders = [_Sender(session, extra_kwargs) for session in connections]
+    tasks = [asyncio.ensure_future(send(sender)) for sender in senders]
+    try:
+        if hasattr(datatuple, "__aiter__"):
+            async for datas in datatuple:
+                await queue.put(_materialize(datas))
+        else:
+            for datas in datatuple:
+                await queue.put(_materialize(datas))
+    finally:
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+    return sum(sender.result() for sender in senders)
+
+
+def run_asend_mass_html_mail(datatuple, **kwargs):
+    """
+    Send with asend_mass_html_mail from synchronous code, in a new event loop
+
+    :param datatuple: the iterable or asynchronous iterable of datatuples
+    :param kwargs: the asend_mass_html_mail arguments
+    :return: the number of emails sent
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(asend_mass_html_mail(datatuple, **kwargs))
+    finally:
+        loop.close()
@@ -0,0 +1,58 @@
+"""
+signals
+
+Keep the families denormalized data and the events cached headcounts up to date
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Accompany, Event, Family, FamilySearchToken, Guest
+
+
+@receiver(post_save, sender=Guest)
+@receiver(post_save, sender=Accompany)
+@receiver(post_delete, sender=Guest)
+@receiver(post_delete, sender=Accompany)
+def refresh_family_search_tokens(instance, **unused_kwargs):
+    """Refresh the family search tokens when one of its guests or accompanies changed"""
+    FamilySearchToken.objects.refresh([instance.family_id])
+
+
+@receiver(post_save, sender=Guest)
+@receiver(post_save, sender=Accompany)
+@receiver(post_delete, sender=Guest)
+@receiver(post_delete, sender=Accompany)
+def invalidate_member_headcounts(instance, **unused_kwargs):
+    """Invalidate the headcount of the events inviting a changed guest or accompany family"""
+    Event.invalidate_families_headcounts([instance.family_id])
+
+
+@receiver(post_save, sender=Family)
+@receiver(pre_delete, sender=Family)
+def invalidate_family_headcounts(instance, **unused_kwargs):
+    """Invalidate the headcount of the events inviting a changed family"""
+    Event.invalidate_families_headcounts([instance.pk])
+
+
+@receiver(post_save, sender=Event.families.through)
+@receiver(post_delete, sender=Event.families.through)
+def invalidate_invitation_headcount(instance, **unused_kwargs):
+    """Invalidate the headcount of an event when one of its invitations changed"""
+    Event.invalidate_headcounts([instance.event_id])
+
+
+@receiver(post_delete, sender=Event)
+def invalidate_event_headcount(instance, **unused_kwargs):
+    """Forget the headcount of a deleted event"""
+    Event.invalidate_headcounts([instance.pk])
+
+
+@receiver(m2m_changed, sender=Event.families.through)
+def invalidate_families_headcounts(instance, action, reverse, pk_set, **unused_kwargs):
+    """Invalidate the headcount of the events whose families were added, removed or cleared"""
+    if action in ("post_add", "post_remove"):
+        Event.invalidate_headcounts(pk_set if reverse else [instance.pk])
+    elif action == "pre_clear" and reverse:
+        Event.invalidate_families_headcounts([instance.pk])
+    elif action == "pre_clear":
+        Event.invalidate_headcounts([instance.pk])
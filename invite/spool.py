@@ -0,0 +1,160 @@
+"""
+spool
+
+On-disk outbox of the mails, decoupling their rendering from their delivery
+
+The spool directory is organized like a maildir : each message is written to its tmp directory,
+then moved to its new directory once complete. flush_spool (and the flushspool command) claims
+each new message by moving it to the cur directory, sends it, then moves it to the sent or failed
+directory : concurrent flushes never send the same message, and an interrupted send is resumed by
+flushing the spool again.
+"""
+import logging
+import os
+import time
+from email.utils import parseaddr
+from smtplib import SMTPException
+from uuid import uuid4
+
+from django.core.mail import get_connection
+
+from .send_mass_html_mail import _create_message
+
+TMP, NEW, CUR, SENT, FAILED = "tmp", "new", "cur", "sent", "failed"
+# the envelope headers, written before the message and stripped before its delivery
+ENVELOPE_FROM = b"X-Invite-Envelope-From: "
+ENVELOPE_TO = b"X-Invite-Envelope-To: "
+
+
+def _makedirs(spool_dir):
+    """Create the spool directories"""
+    for name in (TMP, NEW, CUR, SENT, FAILED):
+        os.makedirs(os.path.join(spool_dir, name), exist_ok=True)
+
+
+def spool_mass_html_mail(datatuple, spool_dir, **extra_kwargs):
+    """
+    Write the messages of a (subject, text_content, html_content, from_email, recipient_list)
+    datatuple to the spool, to be sent by flush_spool
+
+    :param datatuple: the iterable of the messages datatuples
+    :param spool_dir: the spool directory, created if needed
+    :param extra_kwargs: the EmailMultiAlternatives extra arguments, like reply_to
+    :return: the number of spooled messages
+    """
+    _makedirs(spool_dir)
+    prefix = "%d.%s" % (time.time(), uuid4().hex)
+    count = 0
+    for datas in datatuple:
+        message = _create_message(datas, **extra_kwargs)
+        recipients = message.recipients()
+        if not recipients:
+            continue
+        name = "%s.%08d" % (prefix, count)
+        path = os.path.join(spool_dir, TMP, name)
+        with open(path, "wb") as spool_file:
+            spool_file.write(ENVELOPE_FROM + parseaddr(message.from_email)[1].encode() + b"\n")
+            spool_file.write(ENVELOPE_TO + ", ".join(
+                parseaddr(recipient)[1] for recipient in recipients).encode() + b"\n")
+            spool_file.write(message.message().as_bytes())
+        os.replace(path, os.path.join(spool_dir, NEW, name))
+        count += 1
+    return count
+
+
+class SpooledMIMEMessage:
+    """The MIME message of a spooled message, written as it was spooled"""
+    def __init__(self, data):
+        self.data = data
+
+    def as_bytes(self, unixfrom=False, linesep="\n"):  # pylint: disable=unused-argument
+        """The message bytes, with the requested line separator"""
+        return self.data.replace(b"\r\n", b"\n").replace(b"\n", linesep.encode())
+
+    @staticmethod
+    def get_charset():
+        """The spooled messages are written in utf-8 by their parts"""
+        return None
+
+
+class SpooledMessage:
+    """A spooled message file, with the email message interface used by the mail backends"""
+    encoding = None
+
+    def __init__(self, path):
+        with open(path, "rb") as spool_file:
+            from_line = spool_file.readline()
+            to_line = spool_file.readline()
+            if not from_line.startswith(ENVELOPE_FROM) or not to_line.startswith(ENVELOPE_TO):
+                raise ValueError("%s is not a spooled message" % path)
+            self.data = spool_file.read()
+        self.from_email = from_line[len(ENVELOPE_FROM):].decode().strip()
+        self.to = to_line[len(ENVELOPE_TO):].decode().strip().split(", ")  # pylint: disable=invalid-name
+
+    def recipients(self):
+        """List the envelope recipients"""
+        return self.to
+
+    def message(self):
+        """The spooled MIME message"""
+        return SpooledMIMEMessage(self.data)
+
+
+def flush_spool(spool_dir, connection=None, fail_silently=False):
+    """
+    Send the new messages of the spool in their spooling order, over one connection
+
+    Each message is claimed by moving it to the cur directory, so the messages claimed by a
+    concurrent flush are skipped. It is then moved to the sent directory once sent, or to the
+    failed one when the mail server refuses it. The messages left in the cur directory by an
+    interrupted flush are sent again once requeued (see requeue).
+
+    :param spool_dir: the spool directory
+    :param connection: the mail backend connection, the default one if not set
+    :param fail_silently: wether the default connection ignores the sending errors
+    :return: the number of sent and failed messages
+    """
+    _makedirs(spool_dir)
+    new_dir = os.path.join(spool_dir, NEW)
+    connection = connection or get_connection(fail_silently=fail_silently)
+    sent = failed = 0
+    connection.open()
+    try:
+        for name in sorted(os.listdir(new_dir)):
+            path = os.path.join(spool_dir, CUR, name)
+            try:
+                os.rename(os.path.join(new_dir, name), path)
+            except FileNotFoundError:  # claimed by a concurrent flush
+                continue
+            try:
+                result = connection.send_messages([SpooledMessage(path)])
+            except (SMTPException, ValueError) as exception:
+                logging.warning("%s : %s", name, exception)
+                result = 0
+            if result:
+                sent += 1
+                os.replace(path, os.path.join(spool_dir, SENT, name))
+            else:
+                failed += 1
+                os.replace(path, os.path.join(spool_dir, FAILED, name))
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def requeue(spool_dir, directory=FAILED):
+    """
+    Move the failed messages (or the ones left claimed by an interrupted flush) of the spool back
+    to its new directory, to send them again
+
+    Requeue the cur directory only when no flush is running : its messages would be sent twice.
+
+    :param spool_dir: the spool directory
+    :param directory: the spool sub directory to requeue, FAILED or CUR
+    :return: the number of requeued messages
+    """
+    _makedirs(spool_dir)
+    names = os.listdir(os.path.join(spool_dir, directory))
+    for name in names:
+        os.replace(os.path.join(spool_dir, directory, name), os.path.join(spool_dir, NEW, name))
+    return len(names)
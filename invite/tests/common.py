@@ -3,9 +3,11 @@ Django-invite common test mixin
 
 Created by lmarvaud on 01/01/2019
 """
+import socketserver
 from datetime import date
-
+from email import message_from_bytes
 from os import path
+from threading import Thread
 
 from invite.models import Family, Guest, Accompany, Event, MailTemplate
 
@@ -144,6 +146,7 @@ class MockRequest:  # pylint: disable=too-few-public-methods
     """Fake request"""
     _instance = None
     method = "GET"
+    GET = {}
 
     def __init__(self):
         """Initialize the user"""
@@ -155,3 +158,55 @@ class MockRequest:  # pylint: disable=too-few-public-methods
         if not cls._instance:
             cls._instance = cls()
         return cls._instance
+
+
+class SMTPStandInHandler(socketserver.StreamRequestHandler):
+    """One SMTP session of the stand-in server, accepting every message"""
+    def reply(self, line):
+        """Write a reply line"""
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        """Answer the SMTP commands until QUIT"""
+        self.reply("220 localhost SMTP stand-in")
+        mail_from, rcpt_tos = None, []
+        for line in self.rfile:
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            if verb == "MAIL":
+                mail_from = command.split(":", 1)[1].split()[0].strip("<>")
+            elif verb == "RCPT":
+                rcpt_tos.append(command.split(":", 1)[1].split()[0].strip("<>"))
+            elif verb == "RSET":
+                mail_from, rcpt_tos = None, []
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = b"".join(iter(self.rfile.readline, b".\r\n"))
+                self.server.messages.append((mail_from, rcpt_tos, message_from_bytes(data)))
+                mail_from, rcpt_tos = None, []
+            self.reply("250 localhost" if verb in ("EHLO", "HELO") else "250 OK")
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """
+    In-process SMTP server stand-in, keeping the received (from, recipients, message) tuples
+
+    Use it as a context manager, with the EMAIL_PORT setting overridden with its port
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPStandInHandler)
+        self.messages = []
+        self.port = self.server_address[1]
+
+    def __enter__(self):
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *unused_exc_info):
+        self.shutdown()
+        self.server_close()
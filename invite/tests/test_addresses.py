@@ -0,0 +1,41 @@
+"""
+test invite.addresses
+"""
+from unittest import TestCase
+
+from invite.addresses import format_addresses, normalize_email, unique_recipients
+
+
+class TestAddresses(TestCase):
+    """
+    test invite.addresses functions
+    """
+    def test_normalize_email(self):
+        """test the email are stripped and lowered"""
+        self.assertEqual(normalize_email(" Valid@Example.COM\n"), "valid@example.com")
+
+    def test_format_addresses(self):
+        """test each normalized email is used once, as written, with its first name"""
+        self.assertListEqual(list(format_addresses([
+            ("Françoise", "valid@example.com"),
+            ("Jean", " VALID@example.com "),
+            ("Marie", ""),
+            ("", "other@example.com"),
+            ("Michel", " Other@example.com"),
+        ])), ["Françoise <valid@example.com>", "Michel <Other@example.com>"])
+
+    def test_unique_recipients(self):
+        """test the recipients already sent to are removed, and the emptied messages skipped"""
+        datatuple = [
+            ("Subject", "Text", "Html", None, ["Françoise <valid@example.com>"]),
+            ("Subject", "Text", "Html", None, ["Jean <Valid@example.com>",
+                                               "Michel <other@example.com>"]),
+            ("Subject", "Text", "Html", None, ["Michelle <OTHER@example.com>"]),
+        ]
+        seen = set()
+
+        self.assertListEqual(list(unique_recipients(datatuple, seen)), [
+            ("Subject", "Text", "Html", None, ["Françoise <valid@example.com>"]),
+            ("Subject", "Text", "Html", None, ["Michel <other@example.com>"]),
+        ])
+        self.assertSetEqual(seen, {"valid@example.com", "other@example.com"})
@@ -3,24 +3,28 @@ test_admin
 
 Created by lmarvaud on 03/11/2018
 """
+import os
 from collections import Iterable
+from tempfile import TemporaryDirectory
 from unittest.mock import patch, Mock
 
 from django.contrib.admin import AdminSite
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.db import connection
 from django.shortcuts import reverse
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from invite.tests.common import TestEventMixin, TestMailTemplateMixin, MockSuperUser, MockRequest
 from invite import admin
-from invite.models import Family, Guest, Event
+from invite.models import Family, Guest, Event, MailTemplate
 
 
 class TestMail(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint: disable=too-many-ancestors
     """Test admin mail action"""
 
     @patch.object(admin, 'send_mass_html_mail')
-    @patch.object(admin.settings, 'INVITE_HOSTS',
-                  {"Marie": "test_send_mass_html_mail_reply_to@example.com"})
+    @override_settings(INVITE_HOSTS={"Marie": "test_send_mass_html_mail_reply_to@example.com"})
     def test_send_mass_html_mail_reply_to(self, send_mass_html_mail__mock: Mock):
         """Check send_mass_html_mail_reply reply_to argument"""
         events = Event.objects.filter(pk=self.event.pk)
@@ -51,12 +55,13 @@ class TestMail(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint: disa
         self.assertEqual(html, self.expected_html)
         self.assertIsNone(from_email)
         self.assertListEqual(list(recipient),
-                             ["Françoise <valid@example.com>", "Jean <valid@example.com>"])
+                             ["Françoise <valid@example.com>"])
 
     @patch.object(admin, 'send_mass_html_mail')
-    @patch.object(admin.settings, 'INVITE_HOSTS',
-                  {"Marie": "test_using_invite_use_host_in_from_email@example.com"})
-    @patch.object(admin.settings, 'INVITE_USE_HOST_IN_FROM_EMAIL', True, create=True)
+    @override_settings(
+        INVITE_HOSTS={"Marie": "test_using_invite_use_host_in_from_email@example.com"},
+        INVITE_USE_HOST_IN_FROM_EMAIL=True
+    )
     def test_using_invite_use_host_in_from_email(self, send_mass_html_mail__mock: Mock):
         """Test mail using INVITE_USE_HOST_IN_FROM_EMAIL setting"""
         events = Event.objects.filter(pk=self.event.pk)
@@ -68,8 +73,7 @@ class TestMail(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint: disa
         self.assertEqual(from_email, "Marie <test_using_invite_use_host_in_from_email@example.com>")
 
     @patch.object(admin, 'send_mass_html_mail')
-    @patch.object(admin.settings, 'INVITE_HOSTS',
-                  {"Marie": "test_send_mass_html_mail_reply_to@example.com"})
+    @override_settings(INVITE_HOSTS={"Marie": "test_send_mass_html_mail_reply_to@example.com"})
     def test_send_mass_html_mail_to_send_no_email(self, send_mass_html_mail__mock: Mock):
         """Check send_mass_html_mail_reply reply_to argument"""
         self.family.guests.add(
@@ -82,7 +86,61 @@ class TestMail(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint: disa
 
         recipient = list(send_mass_html_mail__mock.call_args[0][0])[0][4]
         self.assertListEqual(list(recipient),
-                             ["Françoise <valid@example.com>", "Jean <valid@example.com>"])
+                             ["Françoise <valid@example.com>"])
+
+
+    @patch.object(admin, 'send_mass_html_mail')
+    @override_settings(INVITE_MERGE_EVENTS_MAILS=True)
+    def test_send_mass_html_mail_events_merge(self, send_mass_html_mail__mock: Mock):
+        """Check the messages of several events are merged per family"""
+        event2 = self.create_event(self.family, name="test2")
+        MailTemplate.objects.create(event=event2, subject="Party", text="Text", html="Html")
+        events = Event.objects.filter(pk__in=[self.event.pk, event2.pk])
+
+        admin.EventAdmin.send_mail(Mock(), None, events)
+
+        to_send = list(send_mass_html_mail__mock.call_args[0][0])
+        self.assertEqual(len(to_send), 1)
+        self.assertEqual(to_send[0][0], "Save the date and Party")
+        event2.delete()
+
+    @patch.object(admin, 'send_mass_html_mail')
+    @override_settings(INVITE_UNIQUE_RECIPIENTS=True)
+    def test_send_mass_html_mail_unique_recipients(self, send_mass_html_mail__mock: Mock):
+        """Check an email shared by two families is only sent once"""
+        family2 = self.create_family(name_suffix="2")
+        self.event.families.add(family2)
+        events = Event.objects.filter(pk=self.event.pk)
+
+        admin.EventAdmin.send_mail(Mock(), None, events)
+
+        to_send = list(send_mass_html_mail__mock.call_args[0][0])
+        self.assertEqual(len(to_send), 1)
+        self.assertListEqual(to_send[0][4], ["Françoise <valid@example.com>"])
+
+    @patch.object(admin, 'run_asend_mass_html_mail', return_value=1)
+    @override_settings(INVITE_ASYNC_SEND=True, INVITE_SEND_THREADS=3)
+    def test_send_mail_async(self, run_asend_mass_html_mail__mock: Mock):
+        """Check the messages are sent asynchronously when INVITE_ASYNC_SEND is set"""
+        events = Event.objects.filter(pk=self.event.pk)
+        model_admin = Mock()
+
+        admin.EventAdmin.send_mail(model_admin, None, events)
+
+        self.assertEqual(len(list(run_asend_mass_html_mail__mock.call_args[0][0])), 1)
+        self.assertEqual(run_asend_mass_html_mail__mock.call_args[1]["sessions"], 3)
+        model_admin.message_user.assert_called_once_with(None, "1 messages send")
+
+    def test_send_mail_spool(self):
+        """Check the messages are written to the spool when INVITE_SPOOL_DIR is set"""
+        events = Event.objects.filter(pk=self.event.pk)
+        model_admin = Mock()
+
+        with TemporaryDirectory() as spool_dir, override_settings(INVITE_SPOOL_DIR=spool_dir):
+            admin.EventAdmin.send_mail(model_admin, None, events)
+
+            self.assertEqual(len(os.listdir(os.path.join(spool_dir, "new"))), 1)
+        model_admin.message_user.assert_called_once_with(None, "1 messages spooled")
 
 
 class TestFamilyAdmin(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint: disable=too-many-ancestors
@@ -99,7 +157,8 @@ class TestFamilyAdmin(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylin
     def test_get_fields(self):
         """Test get_fields method"""
         fadm = admin.FamilyAdmin(Family, self.site)
-        expected_fields = ['invited_midday', 'invited_afternoon', 'invited_evening', 'host', ]
+        expected_fields = ['invited_midday', 'invited_afternoon', 'invited_evening', 'host',
+                           'language', ]
         self.assertListEqual(list(fadm.get_form(MockRequest.instance()).base_fields),
                              expected_fields)
         self.assertEqual(list(fadm.get_fields(MockRequest.instance())), expected_fields)
@@ -111,6 +170,97 @@ class TestFamilyAdmin(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylin
         fadm = admin.FamilyAdmin(Family, self.site)
         self.assertListEqual(list(fadm.get_list_display(MockRequest.instance())), ["__str__"])
 
+    def test_get_search_results(self):
+        """Test the families search by guests and accompanies names"""
+        family2 = self.create_family(name_suffix="2")
+        fadm = admin.FamilyAdmin(Family, self.site)
+
+        queryset, use_distinct = fadm.get_search_results(MockRequest.instance(),
+                                                         Family.objects.all(), "michelle2")
+
+        self.assertFalse(use_distinct)
+        self.assertListEqual(list(queryset), [family2])
+        queryset, _ = fadm.get_search_results(MockRequest.instance(), Family.objects.all(), "")
+        self.assertEqual(queryset.count(), 2)
+        family2.delete()
+
+    @staticmethod
+    def _action_request(action, data):
+        """Create an action request"""
+        request = RequestFactory().post("/", dict(data, action=action))
+        request.user = MockSuperUser()
+        request._messages = CookieStorage(request)  # pylint: disable=protected-access
+        return request
+
+    def test_invite_to_event_form(self):
+        """Test the invitation action asks for the event"""
+        fadm = admin.FamilyAdmin(Family, self.site)
+        event3 = Event.objects.create(name="test3")
+
+        response = fadm.invite_to_event(
+            self._action_request("invite_to_event", {"_selected_action": [self.family.pk]}),
+            Family.objects.filter(pk=self.family.pk)
+        ).render()
+
+        self.assertFalse(event3.families.exists())
+        self.assertContains(response, '<input type="hidden" name="_selected_action" value="%d">' %
+                            self.family.pk, html=True)
+        event3.delete()
+
+    @patch.object(admin, 'send_mass_html_mail', return_value=2)
+    def test_invite_to_event(self, send_mass_html_mail__mock: Mock):
+        """Test the invitation action links the families in bulk and send them the mail"""
+        family2 = self.create_family(name_suffix="2")
+        fadm = admin.FamilyAdmin(Family, self.site)
+
+        response = fadm.invite_to_event(
+            self._action_request("invite_to_event",
+                                 {"apply": "1", "event": self.event.pk, "send_mail": "on"}),
+            Family.objects.filter(pk__in=[self.family.pk, family2.pk])
+        )
+
+        self.assertIsNone(response)
+        self.assertSetEqual(set(self.event.families.all()), {self.family, family2})
+        self.assertEqual(len(list(send_mass_html_mail__mock.call_args[0][0])), 2)
+        family2.delete()
+
+    def test_purge_selected(self):
+        """Test the purge action asks for a confirmation then deletes the families"""
+        family2 = self.create_family(name_suffix="2")
+        fadm = admin.FamilyAdmin(Family, self.site)
+        request = self._action_request("purge_selected", {"_selected_action": [family2.pk]})
+
+        response = fadm.purge_selected(request, Family.objects.filter(pk=family2.pk)).render()
+
+        self.assertContains(response, "delete the 1 selected families")
+        self.assertTrue(Family.objects.filter(pk=family2.pk).exists())
+
+        request = self._action_request("purge_selected", {"apply": "1"})
+        self.assertIsNone(fadm.purge_selected(request, Family.objects.filter(pk=family2.pk)))
+        self.assertFalse(Family.objects.filter(pk=family2.pk).exists())
+        self.assertTrue(Family.objects.filter(pk=self.family.pk).exists())
+
+    def test_purge_selected_permission(self):
+        """Test the purge action is only available to the users allowed to delete families"""
+        fadm = admin.FamilyAdmin(Family, self.site)
+        request = RequestFactory().get("/")
+        request.user = MockSuperUser()
+
+        self.assertIn("purge_selected", fadm.get_actions(request))
+
+        request.user = Mock(has_perm=lambda perm: perm != "invite.delete_family")
+        self.assertNotIn("purge_selected", fadm.get_actions(request))
+        self.assertIn("invite_to_event", fadm.get_actions(request))
+
+    def test_invite_to_event_permission(self):
+        """Test the invitation action is only available to the users allowed to change families"""
+        fadm = admin.FamilyAdmin(Family, self.site)
+        request = RequestFactory().get("/")
+        request.user = Mock(has_perm=lambda perm: perm != "invite.change_family")
+
+        self.assertNotIn("invite_to_event", fadm.get_actions(request))
+        self.assertIn("purge_selected", fadm.get_actions(request))
+
     def _send_form(self):
         """Mixin function to send email on the formset with cleaned data"""
         path = reverse("admin:invite_family_change", kwargs={"object_id": self.family.pk})
@@ -144,8 +294,7 @@ class TestFamilyAdmin(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylin
             fadm.changeform_view(request_mock, str(self.family.pk), path)
 
     @patch.object(admin, 'send_mass_html_mail')
-    @patch.object(admin.settings, 'INVITE_HOSTS',
-                  {"Marie": "test_send_mass_html_mail_reply_to@example.com"})
+    @override_settings(INVITE_HOSTS={"Marie": "test_send_mass_html_mail_reply_to@example.com"})
     def test_send_mass_html_mail_reply_to(self, send_mass_html_mail__mock: Mock):
         """Check send_mass_html_mail_reply reply_to argument"""
         self._send_form()
@@ -172,12 +321,13 @@ class TestFamilyAdmin(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylin
         self.assertEqual(html, self.expected_html)
         self.assertIsNone(from_email)
         self.assertListEqual(list(recipient),
-                             ["Françoise <valid@example.com>", "Jean <valid@example.com>"])
+                             ["Françoise <valid@example.com>"])
 
     @patch.object(admin, 'send_mass_html_mail')
-    @patch.object(admin.settings, 'INVITE_HOSTS',
-                  {"Marie": "test_using_invite_use_host_in_from_email@example.com"})
-    @patch.object(admin.settings, 'INVITE_USE_HOST_IN_FROM_EMAIL', True, create=True)
+    @override_settings(
+        INVITE_HOSTS={"Marie": "test_using_invite_use_host_in_from_email@example.com"},
+        INVITE_USE_HOST_IN_FROM_EMAIL=True
+    )
     def test_using_invite_use_host_in_from_email(self, send_mass_html_mail__mock: Mock):
         """Test Family Invitation Formset send mail using INVITE_USE_HOST_IN_FROM_EMAIL setting"""
         self._send_form()
@@ -187,8 +337,7 @@ class TestFamilyAdmin(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylin
         self.assertEqual(from_email, "Marie <test_using_invite_use_host_in_from_email@example.com>")
 
     @patch.object(admin, 'send_mass_html_mail')
-    @patch.object(admin.settings, 'INVITE_HOSTS',
-                  {"Marie": "test_send_mass_html_mail_reply_to@example.com"})
+    @override_settings(INVITE_HOSTS={"Marie": "test_send_mass_html_mail_reply_to@example.com"})
     def test_fifs_send_mass_html_mail_to_send_no_email(self, send_mass_html_mail__mock: Mock):
         """Check send_mass_html_mail_reply reply_to argument"""
         self.family.guests.add(
@@ -200,7 +349,7 @@ class TestFamilyAdmin(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylin
 
         recipient = list(send_mass_html_mail__mock.call_args[0][0])[0][4]
         self.assertListEqual(list(recipient),
-                             ["Françoise <valid@example.com>", "Jean <valid@example.com>"])
+                             ["Françoise <valid@example.com>"])
 
 
 class TestEventAdmin(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint: disable=too-many-ancestors
@@ -217,6 +366,7 @@ class TestEventAdmin(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint
         expected_fields = ['name', 'date', ]
         self.assertListEqual(list(fadm.get_form(MockRequest.instance()).base_fields),
                              expected_fields)
+        expected_fields.append('show_headcount')
         self.assertEqual(list(fadm.get_fields(MockRequest.instance())), expected_fields)
         self.assertEqual(list(fadm.get_fields(MockRequest.instance(), self.event)), expected_fields)
 
@@ -225,6 +375,23 @@ class TestEventAdmin(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint
         fadm = admin.EventAdmin(Event, self.site)
         self.assertListEqual(list(fadm.get_list_display(MockRequest.instance())), ["__str__"])
 
+    def test_headcount_view(self):
+        """Test the headcount report view"""
+        fadm = admin.EventAdmin(Event, self.site)
+
+        request = RequestFactory().get("/")
+        request.user = MockSuperUser()
+
+        response = fadm.headcount_view(request, self.event.pk).render()
+
+        self.assertEqual(response.context_data["sections"][0][1]["families"], 2)
+        self.assertContains(response, "<td>4</td>", html=True)
+
+    def test_show_headcount(self):
+        """Test the headcount report link"""
+        self.assertIn(reverse("admin:invite_event_headcount", kwargs={"event_id": self.event.pk}),
+                      admin.EventAdmin.show_headcount(self.event))
+
     def test_inlines(self):
         """Test inlines"""
         fadm = admin.EventAdmin(Event, self.site)
@@ -262,8 +429,7 @@ class TestEventAdmin(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint
             fadm.changeform_view(request_mock, str(self.event.pk), path)
 
     @patch.object(admin, 'send_mass_html_mail')
-    @patch.object(admin.settings, 'INVITE_HOSTS',
-                  {"Marie": "test_send_mass_html_mail_reply_to@example.com"})
+    @override_settings(INVITE_HOSTS={"Marie": "test_send_mass_html_mail_reply_to@example.com"})
     def test_send_mass_html_mail_reply_to(self, send_mass_html_mail__mock: Mock):
         """Check send_mass_html_mail_reply reply_to argument"""
         self._send_form()
@@ -290,12 +456,13 @@ class TestEventAdmin(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint
         self.assertEqual(html, self.expected_html)
         self.assertIsNone(from_email)
         self.assertListEqual(list(recipient),
-                             ["Françoise <valid@example.com>", "Jean <valid@example.com>"])
+                             ["Françoise <valid@example.com>"])
 
     @patch.object(admin, 'send_mass_html_mail')
-    @patch.object(admin.settings, 'INVITE_HOSTS',
-                  {"Marie": "test_using_invite_use_host_in_from_email@example.com"})
-    @patch.object(admin.settings, 'INVITE_USE_HOST_IN_FROM_EMAIL', True, create=True)
+    @override_settings(
+        INVITE_HOSTS={"Marie": "test_using_invite_use_host_in_from_email@example.com"},
+        INVITE_USE_HOST_IN_FROM_EMAIL=True
+    )
     def test_using_invite_use_host_in_from_email(self, send_mass_html_mail__mock: Mock):
         """Test Family Invitation Formset send mail using INVITE_USE_HOST_IN_FROM_EMAIL setting"""
         self._send_form()
@@ -305,8 +472,7 @@ class TestEventAdmin(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint
         self.assertEqual(from_email, "Marie <test_using_invite_use_host_in_from_email@example.com>")
 
     @patch.object(admin, 'send_mass_html_mail')
-    @patch.object(admin.settings, 'INVITE_HOSTS',
-                  {"Marie": "test_send_mass_html_mail_reply_to@example.com"})
+    @override_settings(INVITE_HOSTS={"Marie": "test_send_mass_html_mail_reply_to@example.com"})
     def test_fifs_send_mass_html_mail_to_send_no_email(self, send_mass_html_mail__mock: Mock):
         """Check send_mass_html_mail_reply reply_to argument"""
         self.family.guests.add(
@@ -318,7 +484,7 @@ class TestEventAdmin(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint
 
         recipient = list(send_mass_html_mail__mock.call_args[0][0])[0][4]
         self.assertListEqual(list(recipient),
-                             ["Françoise <valid@example.com>", "Jean <valid@example.com>"])
+                             ["Françoise <valid@example.com>"])
 
     def test_send_mail_without_mail(self):
         """Test what happend when sending an email using a event without mail template"""
@@ -354,6 +520,53 @@ class TestFamilyInvitationInline(TestMailTemplateMixin, TestEventMixin, TestCase
         )
 
 
+class TestFamilyInvitationInlinePagination(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint: disable=too-many-ancestors
+    """Test FamilyInvitationInline pagination"""
+    def setUp(self):
+        super(TestFamilyInvitationInlinePagination, self).setUp()
+        self.families = [self.create_family(name_suffix=str(index)) for index in range(4)]
+        self.event.families.add(*self.families)
+
+    def tearDown(self):
+        for family in self.families:
+            family.delete()
+        super(TestFamilyInvitationInlinePagination, self).tearDown()
+
+    def _formset(self, page_number=None):
+        """Create an event FamilyInvitationInline formset of a page"""
+        inline = admin.FamilyInvitationInline(Event, AdminSite())
+        inline.per_page = 2
+        request = Mock(GET={inline.page_var: page_number} if page_number else {},
+                       user=MockSuperUser())
+        formset_class = inline.get_formset(request, self.event)
+        return formset_class(instance=self.event, queryset=inline.get_queryset(request))
+
+    def test_first_page(self):
+        """Test only the first page invitations are edited"""
+        formset = self._formset()
+
+        self.assertEqual(formset.page.paginator.count, 5)
+        self.assertEqual(formset.initial_form_count(), 2)
+        self.assertListEqual([form.instance.family for form in formset.initial_forms],
+                             [self.family, self.families[0]])
+
+    def test_last_page(self):
+        """Test the requested page invitations are edited"""
+        formset = self._formset(page_number="3")
+
+        self.assertListEqual([form.instance.family for form in formset.initial_forms],
+                             [self.families[3]])
+
+    def test_show_mail_queries(self):
+        """Test the show_mail links do not query the event mail template"""
+        formset = self._formset()
+
+        with CaptureQueriesContext(connection) as queries:
+            for form in formset.initial_forms:
+                admin.FamilyInvitationInline.show_mail(form.instance)
+        self.assertEqual(len(queries.captured_queries), 1)  # the page objects
+
+
 class TestFamilyInvitationInlineWithoutTemplate(TestEventMixin, TestCase):
     """Test FamilyInvitationInline"""
     def test_show_mail(self):
@@ -0,0 +1,125 @@
+"""
+Test django_invite exportguests command
+"""
+import csv
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from invite import admin
+from invite.models import Family
+from invite.tests.common import TestEventMixin
+
+CSV = (
+    "Email,Tel,Source,Gender,Qui,Accompagnant\n"
+    "\"valid@example.com,correct@example.com\",0123456789,Marie,\"F,M\",\"Jeanne,Pierre\",Paul\n"
+    ",,,,Sous-total,\n"
+    "valid@example.com,,Jean,M,Jacques,\n"
+    ",,,,Sous-total,\n"
+    "valid@example.com,,,F,Anne,\"Michel,Michelle\"\n"
+)
+
+
+def dump_families():
+    """Dump the families data to compare them"""
+    return [
+        (family.invited_midday, family.invited_afternoon, family.invited_evening, family.host,
+         list(family.guests.order_by("pk").values_list("name", "email", "phone", "female")),
+         list(family.accompanies.order_by("pk").values_list("name", "number", "female")))
+        for family in Family.objects.order_by("pk")
+    ]
+
+
+class TestCommand(TestCase):
+    """
+    Test django_invite exportguests command
+    """
+    def test_round_trip(self):
+        """Test the exported csv import the same families"""
+        with tempfile.NamedTemporaryFile('w+') as csv_file:
+            csv_file.write(CSV)
+            csv_file.file.close()
+            call_command("importguests", csv_file.name)
+        expected_families = dump_families()
+
+        with tempfile.NamedTemporaryFile('w+') as csv_file:
+            call_command("exportguests", csv_file.name, chunk_size=1)
+            Family.objects.all().delete()
+            call_command("importguests", csv_file.name)
+
+        self.assertListEqual(dump_families(), expected_families)
+
+    def test_round_trip_separators(self):
+        """Test the names holding a separator are imported again whole"""
+        family = Family.objects.create(host="Marie")
+        family.guests.create(name="Anne & Marie", email="valid@example.com", female=True)
+        family.guests.create(name="Jean, dit Pierre", email="correct@example.com")
+        family.accompanies.create(name="Paul et Luc", number=1)
+        family.accompanies.create(name="Tom and Jerry", number=1)
+        expected_families = dump_families()
+
+        with tempfile.NamedTemporaryFile('w+') as csv_file:
+            call_command("exportguests", csv_file.name)
+            Family.objects.all().delete()
+            call_command("importguests", csv_file.name)
+
+        self.assertListEqual(dump_families(), expected_families)
+
+    def test_round_trip_losses(self):
+        """Test the data the csv format does not hold are lost by an export imported again"""
+        family = Family.objects.create(invited_midday=True, invited_afternoon=True,
+                                       invited_evening=False, host="Marie", language="fr")
+        family.guests.create(name="Jeanne", email="valid@example.com", female=True)
+        family.accompanies.create(name="Paul", number=3, female=False)
+        Family.objects.create(host="Marie").guests.create(name="Pierre", email=None)
+        without_email = Family.objects.create(host="Marie")
+        without_email.guests.create(name="Julie", email=None, female=True)
+        without_email.guests.create(name="Luc", email=None)
+
+        with tempfile.NamedTemporaryFile('w+') as csv_file:
+            call_command("exportguests", csv_file.name)
+            Family.objects.all().delete()
+            call_command("importguests", csv_file.name)
+
+        family = Family.objects.get()
+        self.assertTrue(family.invited_evening)
+        self.assertEqual(family.language, "")
+        self.assertEqual(family.accompanies.get().number, 1)
+        self.assertEqual(family.guests.get().name, "Jeanne")
+
+    def test_output(self):
+        """Test the exported csv rows"""
+        with tempfile.NamedTemporaryFile('w+') as csv_file:
+            csv_file.write(CSV)
+            csv_file.file.close()
+            call_command("importguests", csv_file.name)
+        output = StringIO()
+
+        call_command("exportguests", stdout=output)
+
+        self.assertListEqual(list(csv.reader(StringIO(output.getvalue()))), [
+            ["Email", "Phone", "Host", "Gender", "Surname", "Accompany surname"],
+            ["valid@example.com,correct@example.com", "0123456789,", "Marie", "F,M",
+             "Jeanne,Pierre", "Paul"],
+            ["", "", "", "", "Sous-total", ""],
+            ["valid@example.com", "", "Jean", "M", "Jacques", ""],
+            ["", "", "", "", "Sous-total", ""],
+            ["valid@example.com", "", "", "F", "Anne", "Michel,Michelle"],
+        ])
+
+
+class TestExportAction(TestEventMixin, TestCase):
+    """
+    Test the family admin export action
+    """
+    def test_export_guests(self):
+        """Test the action stream the selected families"""
+        response = admin.FamilyAdmin.export_guests(None, None, Family.objects.all())
+
+        rows = list(csv.reader(StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertListEqual(rows[-1], ["valid@example.com,valid@example.com",
+                                        "0123456789,0123456789", "Marie", "F,M",
+                                        "Françoise,Jean", "Michel,Michelle"])
@@ -0,0 +1,40 @@
+"""
+Test django_invite flushspool command
+"""
+import os
+from io import StringIO
+from tempfile import TemporaryDirectory
+
+from django.core import mail
+from django.core.management import call_command, CommandError
+from django.test import TestCase, override_settings
+
+from invite.spool import spool_mass_html_mail
+
+
+class TestCommand(TestCase):
+    """
+    Test django_invite flushspool command
+    """
+    def test_flush(self):
+        """Test the spooled messages are sent"""
+        with TemporaryDirectory() as spool_dir:
+            spool_mass_html_mail([("subject", "text", "html", None, ["recipient@example.com"])],
+                                 spool_dir)
+            name, = os.listdir(os.path.join(spool_dir, "new"))
+            os.replace(os.path.join(spool_dir, "new", name),
+                       os.path.join(spool_dir, "failed", name))
+            stdout = StringIO()
+
+            with override_settings(INVITE_SPOOL_DIR=spool_dir):
+                call_command("flushspool", retry_failed=True, stdout=stdout)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(stdout.getvalue(),
+                         "1 failed messages requeued\n1 messages sent, 0 failed\n")
+
+    @override_settings(INVITE_SPOOL_DIR=None)
+    def test_no_spool_dir(self):
+        """Test the spool directory is required"""
+        with self.assertRaises(CommandError):
+            call_command("flushspool", stdout=StringIO())
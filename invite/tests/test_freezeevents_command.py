@@ -0,0 +1,45 @@
+"""
+Test django_invite freezeevents command
+"""
+from io import StringIO
+from unittest import TestCase
+
+from django.core.management import call_command, CommandError
+
+from invite.models import Event, FamilyContextSnapshot
+from invite.tests.common import TestEventMixin, TestMailTemplateMixin
+
+
+class TestCommand(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint: disable=too-many-ancestors
+    """
+    Test django_invite freezeevents command
+    """
+    def test_freeze(self):
+        """Test the families contexts are snapshot and used to render"""
+        call_command("freezeevents", str(self.event.pk), stdout=StringIO())
+
+        self.assertEqual(FamilyContextSnapshot.objects.filter(event=self.event).count(), 1)
+        self.family.guests.filter(name="Jean").update(name="Pierre")
+        event = Event.objects.get(pk=self.event.pk)
+        self.assertTrue(event.is_frozen)
+        _subject, text, html, _from_email, _recipients = next(
+            event.gen_mass_emails(event.families.all(), processes=1))
+        self.assertEqual(text, self.expected_text)
+        self.assertEqual(html, self.expected_html)
+        self.assertEqual(event.context(self.family)["guests"], "Françoise and Jean")
+
+    def test_invalidate(self):
+        """Test the invalidated events are rendered from the live data"""
+        self.event.freeze()
+        self.family.guests.filter(name="Jean").update(name="Pierre")
+
+        call_command("freezeevents", str(self.event.pk), invalidate=True, stdout=StringIO())
+
+        event = Event.objects.get(pk=self.event.pk)
+        self.assertFalse(event.is_frozen)
+        self.assertEqual(event.context(self.family)["guests"], "Françoise and Pierre")
+
+    def test_unknown_event(self):
+        """Test unknown events are reported"""
+        with self.assertRaises(CommandError):
+            call_command("freezeevents", str(self.event.pk + 1), stdout=StringIO())
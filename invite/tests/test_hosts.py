@@ -0,0 +1,36 @@
+"""
+test invite.hosts
+"""
+from django.test import SimpleTestCase, override_settings
+
+from invite.hosts import HostDirectory, get_host_directory
+
+
+class TestHostDirectory(SimpleTestCase):
+    """
+    test invite.hosts.HostDirectory
+    """
+    def test_reply_to(self):
+        """test the reply to addresses of all the hosts"""
+        directory = HostDirectory({"Marie": "marie@example.com", "Jean": "jean@example.com"})
+
+        self.assertListEqual(directory.reply_to,
+                             ["Marie <marie@example.com>", "Jean <jean@example.com>"])
+
+    def test_from_email(self):
+        """test the from email is only used with INVITE_USE_HOST_IN_FROM_EMAIL"""
+        hosts = {"Marie": "marie@example.com"}
+
+        self.assertIsNone(HostDirectory(hosts).from_email("Marie"))
+        self.assertEqual(HostDirectory(hosts, True).from_email("Marie"),
+                         "Marie <marie@example.com>")
+        self.assertIsNone(HostDirectory(hosts, True).from_email("Marie and Jean"))
+
+    def test_get_host_directory(self):
+        """test the directory is cached and refreshed with the settings"""
+        directory = get_host_directory()
+
+        self.assertIs(get_host_directory(), directory)
+        with override_settings(INVITE_HOSTS={"Pierre": "pierre@example.com"}):
+            self.assertListEqual(get_host_directory().reply_to, ["Pierre <pierre@example.com>"])
+        self.assertListEqual(get_host_directory().reply_to, directory.reply_to)
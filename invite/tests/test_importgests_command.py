@@ -5,11 +5,18 @@ Created by lmarvaud on 01/01/2019
 """
 import tempfile
 from datetime import date
+from io import StringIO
+from unittest.mock import patch, Mock
 
-from django.core.management import call_command
-from django.test import TestCase
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 
-from invite.models import Family, Event
+from invite.management.commands import importguests
+from invite.management.commands.importguests import ImportReport, split_shards
+from invite.models import Accompany, Event, Family, FamilySearchToken, Guest
 
 
 class TestCommand(TestCase):
@@ -156,3 +163,326 @@ class TestCommand(TestCase):
             second_accompany = family.accompanies.last()
             self.assertEqual(second_accompany.name, "Paul")
             self.assertEqual(second_accompany.number, 1)
+
+
+class TestSync(TestCase):
+    """
+    Test django_invite importguests command synchronization
+    """
+    csv = (
+        "Email,Tel,Source,Gender,Qui,Accompagnant\n"
+        "valid@example.com,0123456789,Marie,F,Anne,\n"
+        "correct@example.com,,Jean,M,Pierre,Paul\n"
+        "other@example.com,,Jean,M,Jacques,\n"
+    )
+
+    def import_csv(self, content, **options):
+        """Import a csv content and return the command output"""
+        output = StringIO()
+        with tempfile.NamedTemporaryFile('w+') as csv_file:
+            csv_file.write(content)
+            csv_file.file.close()
+            call_command("importguests", csv_file.name, stdout=output, **options)
+        return output.getvalue()
+
+    def test_sync_unchanged(self):
+        """Test a re-import does not write anything"""
+        self.import_csv(self.csv)
+        family_ids = list(Family.objects.order_by("pk").values_list("pk", flat=True))
+
+        with CaptureQueriesContext(connection) as queries:
+            output = self.import_csv(self.csv, sync=True)
+
+        self.assertIn("0 created, 0 updated, 0 deleted, 3 unchanged", output)
+        self.assertListEqual(list(Family.objects.order_by("pk").values_list("pk", flat=True)),
+                             family_ids)
+        self.assertFalse([query for query in queries.captured_queries
+                          if query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))])
+
+    def test_sync_changes(self):
+        """Test the changed families are updated, the new created and the missing deleted"""
+        self.import_csv(self.csv)
+        anne = Family.objects.get(guests__name="Anne")
+        pierre = Family.objects.get(guests__name="Pierre")
+
+        output = self.import_csv(
+            "Email,Tel,Source,Gender,Qui,Accompagnant\n"
+            "valid@example.com,0123456789,Jean,F,Anne,\n"
+            "correct@example.com,0987654321,Jean,M,Pierre,\"Paul and Marc\"\n"
+            "new@example.com,,Marie,F,Julie,\n",
+            sync=True
+        )
+
+        self.assertIn("1 created, 2 updated, 1 deleted, 0 unchanged", output)
+        self.assertEqual(Family.objects.count(), 3)
+        anne.refresh_from_db()
+        self.assertEqual(anne.host, "Jean")
+        self.assertEqual(pierre.guests.get().phone, "0987654321")
+        self.assertListEqual(list(pierre.accompanies.values_list("name", flat=True)),
+                             ["Paul", "Marc"])
+        self.assertTrue(pierre.search_tokens.filter(token="marc").exists())
+        self.assertFalse(Family.objects.filter(guests__name="Jacques").exists())
+
+    def test_sync_event(self):
+        """Test the synchronized families are linked to the event"""
+        self.import_csv(self.csv)
+
+        self.import_csv(self.csv, sync=True, event_name="Test")
+
+        self.assertEqual(Event.objects.get().families.count(), 3)
+
+    def test_sync_duplicates(self):
+        """Test the families duplicated by previous imports are deleted"""
+        self.import_csv(self.csv)
+        self.import_csv(self.csv)
+        first_ids = list(Family.objects.order_by("pk").values_list("pk", flat=True))[:3]
+
+        output = self.import_csv(self.csv, sync=True)
+
+        self.assertIn("0 created, 0 updated, 3 deleted, 3 unchanged", output)
+        self.assertListEqual(list(Family.objects.order_by("pk").values_list("pk", flat=True)),
+                             first_ids)
+        self.assertListEqual(sorted(Family.objects.values_list("guests__name", flat=True)),
+                             ["Anne", "Jacques", "Pierre"])
+
+    def test_sync_rename(self):
+        """Test renaming and reordering the guests updates their family, keeping its invitations"""
+        self.import_csv(
+            "Email,Tel,Source,Gender,Qui,Accompagnant\n"
+            "\"valid@example.com,correct@example.com\",,Marie,\"F,M\",\"Anne,Pierre\",\n"
+        )
+        family = Family.objects.get()
+        event = Event.objects.create(name="Test")
+        event.families.add(family)
+
+        output = self.import_csv(
+            "Email,Tel,Source,Gender,Qui,Accompagnant\n"
+            "\"Correct@example.com,valid@example.com\",,Marie,\"M,F\",\"Pierrot,Anne\",\n",
+            sync=True
+        )
+
+        self.assertIn("0 created, 1 updated, 0 deleted, 0 unchanged", output)
+        self.assertEqual(Family.objects.get(), family)
+        self.assertListEqual(list(family.guests.values_list("name", flat=True)),
+                             ["Pierrot", "Anne"])
+        self.assertListEqual(list(event.families.all()), [family])
+
+    def test_sync_without_email(self):
+        """Test the families the csv can not express, without any guest email, are kept"""
+        self.import_csv(self.csv)
+        without_email = Family.objects.create(host="Marie")
+        without_email.guests.create(name="Julie", female=True)
+        without_guest = Family.objects.create(host="Marie")
+
+        output = self.import_csv(self.csv, sync=True)
+
+        self.assertIn("0 created, 0 updated, 0 deleted, 3 unchanged", output)
+        self.assertEqual(Family.objects.filter(pk__in=[without_email.pk, without_guest.pk])
+                         .count(), 2)
+
+
+class TestDryRun(TestCase):
+    """
+    Test django_invite importguests command validation
+    """
+    def test_dry_run(self):
+        """Test the issues are reported with their line and nothing is written"""
+        output = StringIO()
+        with tempfile.NamedTemporaryFile('w+') as csv_file:
+            csv_file.write(
+                "Email,Tel,Source,Gender,Qui,Accompagnant\n"
+                "valid@example.com,0123456789,Marie,F,Anne,\n"
+                "invalid,,Unknown,\"M,F\",\"Pierre,Marie\",\n"
+                "correct@example.com,,Jean,M,\"Jacques,Julie\",\n"
+                "other@example.com,,Jean,M,\"Jacques,Julie\",\n"
+            )
+            csv_file.file.close()
+
+            with CaptureQueriesContext(connection) as queries:
+                call_command("importguests", csv_file.name, event_name="Test", dry_run=True,
+                             stdout=output)
+
+        self.assertFalse(queries.captured_queries)
+        self.assertFalse(Event.objects.exists())
+        self.assertListEqual(output.getvalue().splitlines(), [
+            "4 families, 4 issues",
+            "missing gender : 2",
+            "  line 4 : missing gender to Julie : SKIPPED",
+            "  line 5 : missing gender to Julie : SKIPPED",
+            "unknown host : 1",
+            "  line 3 : Unknown source not referenced in the setting INVITE_HOSTS",
+            "invalid email : 1",
+            "  line 3 : invalid email invalid to Pierre",
+        ])
+
+    def test_empty_gender(self):
+        """Test a guest with an empty gender cell is reported, and imported as male"""
+        content = (
+            "Email,Tel,Source,Gender,Qui,Accompagnant\n"
+            "valid@example.com,,Marie,,Paul,\n"
+        )
+        output = StringIO()
+        with tempfile.NamedTemporaryFile('w+') as csv_file:
+            csv_file.write(content)
+            csv_file.file.close()
+            call_command("importguests", csv_file.name, dry_run=True, stdout=output)
+            with self.assertLogs(level="WARNING"):
+                call_command("importguests", csv_file.name, stdout=StringIO())
+
+        self.assertIn("  line 2 : empty gender to Paul : imported as male",
+                      output.getvalue().splitlines())
+        self.assertFalse(Family.objects.get().guests.get(name="Paul").female)
+
+    def test_missing_surname(self):
+        """Test a row without surname is reported and its guest skipped"""
+        output = StringIO()
+        with tempfile.NamedTemporaryFile('w+') as csv_file:
+            csv_file.write(
+                "Email,Tel,Source,Gender,Qui,Accompagnant\n"
+                "valid@example.com,,Marie,F,,\n"
+            )
+            csv_file.file.close()
+            call_command("importguests", csv_file.name, dry_run=True, stdout=output)
+            with self.assertLogs(level="WARNING"):
+                call_command("importguests", csv_file.name, stdout=StringIO())
+
+        self.assertIn("  line 2 : missing surname : SKIPPED", output.getvalue().splitlines())
+        self.assertFalse(Guest.objects.exists())
+
+    def test_too_long(self):
+        """Test the values longer than their database column are reported"""
+        output = StringIO()
+        with tempfile.NamedTemporaryFile('w+') as csv_file:
+            csv_file.write(
+                "Email,Tel,Source,Gender,Qui,Accompagnant\n"
+                "valid@example.com,%s,Marie,F,%s,\n" % ("0" * 21, "A" * 65)
+            )
+            csv_file.file.close()
+            call_command("importguests", csv_file.name, dry_run=True, stdout=output)
+
+        self.assertListEqual(output.getvalue().splitlines(), [
+            "1 families, 2 issues",
+            "too long : 2",
+            "  line 2 : name %s longer than 64 characters" % ("A" * 65),
+            "  line 2 : phone %s longer than 20 characters" % ("0" * 21),
+        ])
+
+    def test_examples_cap(self):
+        """Test only the first examples of each kind are kept"""
+        report = ImportReport(max_examples=2)
+        for line_num in range(2, 12):
+            report.add("missing gender", line_num, "missing")
+
+        self.assertEqual(report.counts["missing gender"], 10)
+        self.assertListEqual(report.examples["missing gender"], [(2, "missing"), (3, "missing")])
+
+
+class TestShards(TestCase):
+    """
+    Test django_invite importguests command sharded import
+    """
+    csv = (
+        "Email,Tel,Source,Gender,Qui,Accompagnant\n"
+        "valid@example.com,0123456789,Marie,F,Anne,\n"
+        "correct@example.com,,Jean,M,Pierre,Paul\n"
+        ",,,,Sous-total,\n"
+        "other@example.com,,Jean,M,Jacques,\n"
+        ",,,,Sous-total,\n"
+        "last@example.com,,,F,Julie,\n"
+    )
+
+    def import_csv(self, **options):
+        """Import the csv and return the imported families content"""
+        with tempfile.NamedTemporaryFile('w+') as csv_file:
+            csv_file.write(self.csv)
+            csv_file.file.close()
+            call_command("importguests", csv_file.name, **options)
+        return sorted(
+            Family.objects.values_list("invited_midday", "invited_afternoon", "invited_evening",
+                                       "host", "guests__name", "accompanies__name",
+                                       "invitations__name")
+        )
+
+    def test_split_shards(self):
+        """Test the rows are split in contiguous ranges"""
+        self.assertListEqual(split_shards([1, 2, 3, 4, 5], 3), [[1, 2], [3, 4], [5]])
+        self.assertListEqual(split_shards([1], 3), [[1]])
+
+    def test_shards(self):
+        """Test the sharded import is the same as the serial import"""
+        serial = self.import_csv(event_name="Test")
+        Family.objects.all().delete()
+
+        sharded = self.import_csv(event_name="Test", shards=3)
+
+        self.assertListEqual(sharded, serial)
+
+    @patch.object(importguests, "Pool")
+    def test_shards_atomic(self, pool: Mock):
+        """Test the rows are imported serially inside a transaction"""
+        with patch.object(connection, "vendor", "postgresql"):
+            self.import_csv(shards=3)
+
+        pool.assert_not_called()
+        self.assertEqual(Family.objects.count(), 4)
+
+    def test_shards_bulk(self):
+        """Test the guests and accompanies are inserted in bulk, without their per row signals"""
+        receiver = Mock()
+        post_save.connect(receiver, sender=Guest)
+        post_save.connect(receiver, sender=Accompany)
+        try:
+            self.import_csv(shards=2)
+        finally:
+            post_save.disconnect(receiver, sender=Guest)
+            post_save.disconnect(receiver, sender=Accompany)
+
+        receiver.assert_not_called()
+        self.assertEqual(Guest.objects.count(), 4)
+        self.assertEqual(Accompany.objects.count(), 1)
+        family = Family.objects.get(pk__in=FamilySearchToken.objects.search("paul"))
+        self.assertEqual(family.guests.get().name, "Pierre")
+
+    def test_shards_sync(self):
+        """Test the sharded import can not be synchronized"""
+        with self.assertRaises(CommandError):
+            self.import_csv(shards=2, sync=True)
+
+
+class SerialPool:
+    """In process stand-in of multiprocessing.Pool, sharing the test database"""
+    def __init__(self, processes, initializer):
+        self.processes = processes
+        initializer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *unused_exc_info):
+        return False
+
+    @staticmethod
+    def map(function, iterable):
+        """Call the function on each item"""
+        return list(map(function, iterable))
+
+
+class TestShardsPool(TransactionTestCase):
+    """
+    Test django_invite importguests command import in a pool of processes
+    """
+    csv = TestShards.csv
+    import_csv = TestShards.import_csv
+
+    def test_shards_pool(self):
+        """Test the rows ranges imported by the pool are the same as the serial import"""
+        serial = self.import_csv(event_name="Test")
+        Family.objects.all().delete()
+        Event.objects.all().delete()
+
+        with patch.object(importguests, "Pool", side_effect=SerialPool) as pool, \
+                patch.object(connection, "vendor", "postgresql"):
+            sharded = self.import_csv(event_name="Test", shards=3)
+
+        self.assertEqual(pool.call_args[0][0], 3)
+        self.assertListEqual(sharded, serial)
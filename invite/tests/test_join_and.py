@@ -5,6 +5,8 @@ Created by lmarvaud on 01/01/2019
 """
 from unittest import TestCase
 
+from django.utils import translation
+
 from invite.join_and import join_and
 
 
@@ -29,3 +31,17 @@ class TestJoinAnd(TestCase):
         self.assertEqual(join_and(["Pierre", "Marie", "Jean"]), "Pierre, Marie and Jean")
         self.assertEqual(join_and(["Pierre", "Marie", "Jean", "Françoise"]),
                          "Pierre, Marie, Jean and Françoise")
+
+    def test_join_and_iterable(self):
+        """test invite.join_and function with generators of one, two and more names"""
+        self.assertEqual(join_and(name for name in []), "")
+        self.assertEqual(join_and(name for name in ["Pierre"]), "Pierre")
+        self.assertEqual(join_and(name for name in ["Pierre", "Marie"]), "Pierre and Marie")
+        self.assertEqual(join_and(name for name in ["Pierre", "Marie", "Jean"]),
+                         "Pierre, Marie and Jean")
+
+    def test_join_and_language(self):
+        """test invite.join_and conjunction follow the active language"""
+        with translation.override("fr"):
+            self.assertEqual(join_and(["Pierre", "Marie"]), "Pierre et Marie")
+        self.assertEqual(join_and(["Pierre", "Marie"]), "Pierre and Marie")
@@ -0,0 +1,46 @@
+"""
+test invite.lazy_context
+"""
+from unittest import TestCase
+from unittest.mock import Mock
+
+from invite.lazy_context import LazyContext
+
+
+class TestLazyContext(TestCase):
+    """
+    test invite.lazy_context.LazyContext mapping
+    """
+    def test_lazy(self):
+        """test values are computed on first access only"""
+        factory = Mock(return_value="value")
+        context = LazyContext({"key": factory})
+
+        factory.assert_not_called()
+        self.assertEqual(context["key"], "value")
+        self.assertEqual(context["key"], "value")
+        factory.assert_called_once_with(context)
+
+    def test_dependencies(self):
+        """test a factory can use the other values of the context"""
+        context = LazyContext({"double": lambda context: context["value"] * 2}, {"value": 2})
+
+        self.assertEqual(context["double"], 4)
+
+    def test_parent(self):
+        """test the parent context is used and not altered"""
+        parent = LazyContext({"key": lambda context: "parent"}, {"other": "other"})
+        context = LazyContext({}, {"key": "child"}, parent=parent)
+
+        self.assertEqual(context["key"], "child")
+        self.assertEqual(context["other"], "other")
+        self.assertEqual(parent["key"], "parent")
+        self.assertListEqual(list(context), ["key", "other"])
+        self.assertEqual(len(context), 2)
+
+    def test_missing(self):
+        """test missing keys"""
+        context = LazyContext({}, parent=LazyContext({}))
+
+        self.assertNotIn("missing", context)
+        self.assertRaises(KeyError, context.__getitem__, "missing")
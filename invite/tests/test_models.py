@@ -3,12 +3,19 @@ Test django-invite models
 
 Created by lmarvaud on 01/01/2019
 """
-from unittest import TestCase
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
 
 from datetime import date
 
-from invite.models import Guest, Accompany, Event
-from invite.tests.common import TestFamilyMixin, TestEventMixin
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase as DjangoTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import translation
+
+from invite.models import Family, Guest, Accompany, Event, MailTemplate, HEADCOUNT_CACHE_KEY
+from invite.tests.common import TestFamilyMixin, TestEventMixin, TestMailTemplateMixin
 
 
 class TestFamily(TestFamilyMixin, TestCase):
@@ -37,7 +44,7 @@ class TestFamily(TestFamilyMixin, TestCase):
 
         result = self.family.context
 
-        self.assertDictEqual(expected_result, result)
+        self.assertDictEqual(expected_result, dict(result))
 
     def test_str(self):
         """
@@ -118,7 +125,18 @@ class TestEvent(TestEventMixin, TestCase):
 
         result = self.event.context(self.family)
 
-        self.assertDictEqual(expected_result, result)
+        self.assertDictEqual(expected_result, dict(result))
+
+    def test_context_does_not_leak(self):
+        """
+        test event context do not alter the family context
+        """
+        event2 = self.create_event(self.family, name="test2")
+
+        self.assertEqual(self.event.context(self.family)["event"], self.event)
+        self.assertEqual(event2.context(self.family)["event"], event2)
+        self.assertNotIn("event", self.family.context)
+        event2.delete()
 
     def test_str_empty(self):
         """
@@ -155,3 +173,288 @@ class TestEvent(TestEventMixin, TestCase):
         event = Event(pk=1, name="Test", date=date(2018, 12, 31))
 
         self.assertEqual(str(event), expected_result)
+
+
+class TestEventMassEmails(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint: disable=too-many-ancestors
+    """
+    Test Event mass emails generation
+    """
+    def setUp(self):
+        super(TestEventMassEmails, self).setUp()
+        self.family2 = self.create_family(name_suffix="2")
+        self.event.families.add(self.family2)
+
+    def tearDown(self):
+        self.family2.delete()
+        super(TestEventMassEmails, self).tearDown()
+
+    def test_gen_mass_emails(self):
+        """test mass emails generation in the current process"""
+        result = [
+            (subject, text, html, from_email, list(recipients))
+            for subject, text, html, from_email, recipients
+            in self.event.gen_mass_emails(self.event.families.order_by("pk"), processes=1)
+        ]
+
+        self.assertEqual(len(result), 2)
+        self.assertTupleEqual(result[0], ("Save the date", self.expected_text, self.expected_html,
+                                          None, ["Françoise <valid@example.com>"]))
+
+    def test_gen_mass_emails_languages(self):
+        """test each family mail is rendered in its language, activated once per language"""
+        family3 = self.create_family(name_suffix="3")
+        Family.objects.filter(pk__in=[self.family2.pk, family3.pk]).update(language="fr")
+        self.event.families.add(family3)
+
+        with patch.object(translation, "activate", wraps=translation.activate) as activate:
+            result = list(self.event.gen_mass_emails(
+                self.event.families.order_by("language", "pk"), processes=1))
+
+        self.assertListEqual([activated[0][0] for activated in activate.call_args_list],
+                             ["fr", "en-us"])
+        self.assertIn("Françoise and Jean", result[0][1])
+        self.assertIn("Françoise2 et Jean2", result[1][1])
+        self.assertIn("Françoise3 et Jean3", result[2][1])
+        self.assertListEqual(list(self.event.gen_mass_emails(
+            self.event.families.order_by("language", "pk"), processes=2)), [
+                (subject, text, html, from_email, list(recipients))
+                for subject, text, html, from_email, recipients in result
+            ])
+        family3.delete()
+
+    def test_gen_mass_emails_languages_frozen(self):
+        """test the frozen families contexts are snapshot and rendered in the families language"""
+        Family.objects.filter(pk=self.family2.pk).update(language="fr")
+        self.event.freeze()
+
+        result = list(self.event.gen_mass_emails(
+            self.event.families.order_by("language", "pk"), processes=1))
+
+        self.event.unfreeze()
+        self.assertIn("Françoise and Jean", result[0][1])
+        self.assertIn("Françoise2 et Jean2", result[1][1])
+        self.assertEqual(translation.get_language(), "en-us")
+
+    def test_gen_mass_emails_processes(self):
+        """test mass emails generation in a pool of processes render the same mails"""
+        families = self.event.families.order_by("pk")
+        expected_result = [
+            (subject, text, html, from_email, list(recipients))
+            for subject, text, html, from_email, recipients
+            in self.event.gen_mass_emails(families, processes=1)
+        ]
+
+        result = list(self.event.gen_mass_emails(families, processes=2))
+
+        self.assertListEqual(result, expected_result)
+
+
+class TestEventInvite(TestEventMixin, TestCase):
+    """
+    Test Event families bulk invitation
+    """
+    def setUp(self):
+        super(TestEventInvite, self).setUp()
+        self.family2 = self.create_family(name_suffix="2")
+
+    def tearDown(self):
+        self.family2.delete()
+        super(TestEventInvite, self).tearDown()
+
+    def test_invite(self):
+        """test only the families not invited yet are linked"""
+        families = Family.objects.filter(pk__in=[self.family.pk, self.family2.pk])
+
+        self.assertEqual(families.invite(self.event), 1)
+        self.assertEqual(families.invite(self.event), 0)
+        self.assertSetEqual(set(self.event.families.all()), {self.family, self.family2})
+
+    def test_invite_batches(self):
+        """test the families are linked with one insert per batch"""
+        self.event.families.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.event.invite([self.family.pk, self.family2.pk, self.family.pk], batch_size=1)
+
+        inserts = [query for query in queries.captured_queries
+                   if query["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(self.event.families.count(), 2)
+
+
+class TestEventHeadcount(TestEventMixin, TestCase):
+    """
+    Test Event headcount report
+    """
+    def setUp(self):
+        cache.clear()
+        super(TestEventHeadcount, self).setUp()
+        self.family2 = self.create_family(name_suffix="2")
+        self.family2.invited_midday = True
+        self.family2.save()
+        self.family2.accompanies.update(female=True)
+        self.event.families.add(self.family2)
+
+    def tearDown(self):
+        self.family2.delete()
+        super(TestEventHeadcount, self).tearDown()
+
+    def test_headcount(self):
+        """test the counts are computed with a single query"""
+        with CaptureQueriesContext(connection) as queries:
+            headcount = self.event.headcount()
+
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertDictEqual(headcount["total"], {
+            "families": 2, "guests": 4, "female_guests": 2, "male_guests": 2,
+            "accompanies": 4, "female_accompanies": 2, "male_accompanies": 2,
+        })
+        self.assertEqual(headcount["midday"]["families"], 1)
+        self.assertEqual(headcount["midday"]["female_accompanies"], 2)
+        self.assertEqual(headcount["afternoon"]["guests"], 0)
+        self.assertEqual(headcount["evening"]["accompanies"], 4)
+
+    def test_headcount_cache(self):
+        """test the counts are cached until the families members change"""
+        self.event.headcount()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.event.headcount()
+        self.assertFalse(queries.captured_queries)
+
+        self.family.guests.create(name="Paul", female=False)
+        self.assertEqual(self.event.headcount()["total"]["guests"], 5)
+        self.family2.accompanies.all().delete()
+        self.assertEqual(self.event.headcount()["total"]["accompanies"], 2)
+
+    def test_headcount_invitations(self):
+        """test the cached counts are invalidated when the event families change"""
+        self.event.headcount()
+
+        self.event.families.remove(self.family2)
+        self.assertEqual(self.event.headcount()["total"]["families"], 1)
+        self.family2.invitations.add(self.event)
+        self.assertEqual(self.event.headcount()["total"]["families"], 2)
+        self.family2.invited_midday = False
+        self.family2.save()
+        self.assertEqual(self.event.headcount()["midday"]["families"], 0)
+        self.family2.invitations.clear()
+        self.assertEqual(self.event.headcount()["total"]["families"], 1)
+
+    def test_headcount_on_commit(self):
+        """test the counts computed before the changes are committed are invalidated"""
+        with transaction.atomic():
+            self.family.guests.create(name="Paul", female=False)
+            cache.set(HEADCOUNT_CACHE_KEY % self.event.pk, "stale")
+
+        self.assertEqual(self.event.headcount()["total"]["guests"], 5)
+
+
+class TestEventsMassEmails(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylint: disable=too-many-ancestors
+    """
+    Test several events mass emails generation
+    """
+    def setUp(self):
+        super(TestEventsMassEmails, self).setUp()
+        self.event2 = self.create_event(self.family, name="test2")
+        MailTemplate.objects.create(event=self.event2, subject="Party", text="Text", html="Html")
+
+    def tearDown(self):
+        self.event2.delete()
+        super(TestEventsMassEmails, self).tearDown()
+
+    def test_gen_events_mass_emails(self):
+        """test each event message is generated for the family"""
+        result = list(Event.gen_events_mass_emails([self.event, self.event2]))
+
+        self.assertListEqual([subject for subject, *_unused in result], ["Save the date", "Party"])
+
+    def test_gen_events_mass_emails_frozen(self):
+        """test the frozen events render their families snapshots"""
+        self.event.freeze()
+
+        result = list(Event.gen_events_mass_emails([Event.objects.get(pk=self.event.pk),
+                                                    self.event2]))
+
+        self.event.unfreeze()
+        self.assertListEqual([text for _subject, text, *_unused in result],
+                             [self.expected_text, "Text"])
+
+    def test_gen_events_mass_emails_managers(self):
+        """test the families records guests and accompanies render like the managers"""
+        MailTemplate.objects.filter(event=self.event2).update(
+            text="{% for guest in family.guests.all %}{{ guest.name }} {% endfor %}"
+                 "{{ family.accompanies.count }}")
+
+        event2 = Event.objects.get(pk=self.event2.pk)
+
+        result = list(Event.gen_events_mass_emails([self.event, event2]))
+
+        self.assertEqual(result[1][1], "Françoise Jean 2")
+        self.assertEqual(event2.mailtemplate.render_text(event2.context(self.family), None),
+                         "Françoise Jean 2")
+
+    def test_gen_events_mass_emails_context(self):
+        """test the family guests are loaded once for all the events"""
+        with CaptureQueriesContext(connection) as queries:
+            list(Event.gen_events_mass_emails([self.event, self.event2]))
+
+        guests_queries = [query for query in queries.captured_queries
+                          if 'FROM "invite_guest"' in query["sql"]]
+        self.assertEqual(len(guests_queries), 1)
+
+    def test_gen_events_mass_emails_merge(self):
+        """test the family messages are merged"""
+        result = list(Event.gen_events_mass_emails([self.event, self.event2], merge=True))
+
+        self.assertEqual(len(result), 1)
+        subject, text, html, from_email, recipients = result[0]
+        self.assertEqual(subject, "Save the date and Party")
+        self.assertEqual(text, self.expected_text + "\n\nText")
+        self.assertEqual(html, self.expected_html + "\n<hr>\nHtml")
+        self.assertIsNone(from_email)
+        self.assertListEqual(recipients, ["Françoise <valid@example.com>"])
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is sqlite specific")
+class TestIndexes(DjangoTestCase):
+    """
+    Test the lookup queries use the guests indexes
+    """
+    @classmethod
+    def setUpTestData(cls):
+        """Create 100k guests in 50k families"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO invite_family "
+                "(invited_midday, invited_afternoon, invited_evening, host, language) "
+                "WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq "
+                "                          WHERE n < 50000) "
+                "SELECT 0, 0, 1, 'Marie', '' FROM seq"
+            )
+            cursor.execute(
+                "INSERT INTO invite_guest (family_id, female, name, email, phone) "
+                "SELECT family.id, gender.female, 'Guest' || family.id, "
+                "       'guest' || family.id || '@example.com', '' "
+                "FROM invite_family family, (SELECT 0 AS female UNION ALL SELECT 1) gender"
+            )
+            cursor.execute("ANALYZE")
+
+    def assert_use_index(self, queryset, index_name):
+        """Assert the queryset query plan use the index"""
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn(index_name, plan)
+
+    def test_family_female(self):
+        """test the family gender lookup use the (family, female) index"""
+        family = Family.objects.first()
+        self.assert_use_index(family.guests.exclude(female=True).values("pk"),
+                              "invite_guest_family_female")
+
+    def test_email(self):
+        """test the email lookup use the email index"""
+        self.assert_use_index(Guest.objects.filter(email="guest1@example.com"),
+                              "invite_guest_email")
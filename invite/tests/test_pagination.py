@@ -0,0 +1,67 @@
+"""
+test invite.pagination
+"""
+from unittest import skipIf
+
+from django.contrib.admin import AdminSite
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from invite import admin
+from invite.models import Family
+from invite.pagination import estimated_count
+from invite.tests.common import MockSuperUser
+
+
+class TestKeysetChangeList(TestCase):
+    """
+    test invite.pagination KeysetChangeList
+    """
+    def setUp(self):
+        self.families = [Family.objects.create(host="Marie") for _ in range(5)]
+        self.model_admin = admin.FamilyAdmin(Family, AdminSite())
+        self.model_admin.list_per_page = 2
+
+    def changelist(self, query=None):
+        """Create the families change list of a request"""
+        request = RequestFactory().get("/", query or {})
+        request.user = MockSuperUser()
+        return self.model_admin.get_changelist_instance(request)
+
+    def test_first_page(self):
+        """test the first page is the last families, without offset"""
+        with CaptureQueriesContext(connection) as queries:
+            changelist = self.changelist()
+
+        self.assertTrue(changelist.keyset)
+        self.assertListEqual(list(changelist.result_list), self.families[:-3:-1])
+        self.assertEqual(changelist.result_count, 5)
+        self.assertIsNone(changelist.first_page_url)
+        self.assertEqual(changelist.next_page_url, "?after=%d" % self.families[3].pk)
+        self.assertFalse([query for query in queries.captured_queries
+                          if "OFFSET" in query["sql"]])
+
+    def test_next_pages(self):
+        """test the next pages are the families after the last primary key"""
+        changelist = self.changelist({"after": self.families[3].pk})
+
+        self.assertListEqual(list(changelist.result_list), self.families[2:0:-1])
+        self.assertEqual(changelist.first_page_url, "?")
+        self.assertEqual(changelist.next_page_url, "?after=%d" % self.families[1].pk)
+
+        changelist = self.changelist({"after": self.families[1].pk})
+
+        self.assertListEqual(list(changelist.result_list), self.families[:1])
+        self.assertIsNone(changelist.next_page_url)
+
+    def test_invalid_after(self):
+        """test an invalid primary key is rejected"""
+        with self.assertRaises(IncorrectLookupParameters):
+            self.changelist({"after": "invalid"})
+
+    @skipIf(connection.vendor == "postgresql", "PostgreSQL counts are estimated")
+    def test_estimated_count(self):
+        """test the count is exact on the databases without statistics"""
+        self.assertTupleEqual(estimated_count(Family.objects.all()), (5, False))
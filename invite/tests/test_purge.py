@@ -0,0 +1,75 @@
+"""
+test invite.purge
+"""
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from invite.models import Accompany, Event, Family, FamilySearchToken, Guest, MailTemplate
+from invite.purge import purge_events, purge_families, purged
+from invite.tests.common import TestEventMixin
+
+
+class TestPurge(TestCase):
+    """
+    test invite.purge functions
+    """
+    def setUp(self):
+        self.family = TestEventMixin.create_family()
+        self.family2 = TestEventMixin.create_family(name_suffix="2")
+        self.event = TestEventMixin.create_event(self.family, self.family2)
+        MailTemplate.objects.create(event=self.event, subject="Subject", text="Text", html="Html")
+        self.event.freeze()
+        self.signals = []
+        purged.connect(self.receive)
+
+    def tearDown(self):
+        purged.disconnect(self.receive)
+
+    def receive(self, sender, ids, counts, **unused_kwargs):
+        """Keep the purged signals"""
+        self.signals.append((sender, ids, counts))
+
+    def test_purge_families(self):
+        """test the families and their related rows are deleted without being loaded"""
+        with CaptureQueriesContext(connection) as queries:
+            counts = purge_families(Family.objects.filter(pk=self.family.pk))
+
+        self.assertDictEqual(dict(counts), {
+            "invite.Family": 1,
+            "invite.Guest": 2,
+            "invite.Accompany": 2,
+            "invite.Event_families": 1,
+            "invite.FamilySearchToken": 4,
+            "invite.FamilyContextSnapshot": 1,
+        })
+        self.assertListEqual(self.signals, [(Family, [self.family.pk], counts)])
+        self.assertFalse(Guest.objects.filter(family_id=self.family.pk).exists())
+        self.assertFalse(FamilySearchToken.objects.filter(family_id=self.family.pk).exists())
+        self.assertListEqual(list(self.event.families.all()), [self.family2])
+        self.assertEqual(Accompany.objects.filter(family=self.family2).count(), 2)
+        self.assertFalse([query for query in queries.captured_queries
+                          if query["sql"].startswith("SELECT")
+                          and 'FROM "invite_guest"' in query["sql"]])
+
+    def test_purge_families_batches(self):
+        """test the families are deleted batch by batch"""
+        counts = purge_families(Family.objects.all(), batch_size=1)
+
+        self.assertEqual(counts["invite.Family"], 2)
+        self.assertFalse(Family.objects.exists())
+        self.assertFalse(self.event.families.exists())
+
+    def test_purge_events(self):
+        """test the events and their related rows are deleted, but not the families"""
+        counts = purge_events(Event.objects.filter(pk=self.event.pk))
+
+        self.assertDictEqual(dict(counts), {
+            "invite.Event": 1,
+            "invite.Event_families": 2,
+            "invite.MailTemplate": 1,
+            "invite.FamilyContextSnapshot": 2,
+        })
+        self.assertListEqual(self.signals, [(Event, [self.event.pk], counts)])
+        self.assertFalse(Event.objects.exists())
+        self.assertEqual(Family.objects.count(), 2)
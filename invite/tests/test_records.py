@@ -0,0 +1,49 @@
+"""
+test invite.records
+"""
+from unittest import TestCase
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from invite.models import Family
+from invite.records import load_family_records
+from invite.tests.common import TestFamilyMixin
+
+
+class TestFamilyRecord(TestFamilyMixin, TestCase):
+    """
+    test invite.records.FamilyRecord
+    """
+    def test_context(self):
+        """test the record context is the family context"""
+        record, = load_family_records(Family.objects.filter(pk=self.family.pk))
+
+        with CaptureQueriesContext(connection) as queries:
+            context = dict(record.context)
+
+        self.assertEqual(len(queries.captured_queries), 0)
+        self.assertIs(context.pop("family"), record)
+        expected_context = dict(self.family.context)
+        expected_context.pop("family")
+        self.assertDictEqual(context, expected_context)
+        self.assertEqual(str(record), str(self.family))
+
+    def test_guest_addresses(self):
+        """test the record guests addresses are the family ones"""
+        record, = load_family_records(Family.objects.filter(pk=self.family.pk))
+
+        self.assertListEqual(list(record.guest_addresses()), list(self.family.guest_addresses()))
+
+    def test_load_family_records(self):
+        """test the families are loaded with their guests and accompanies by chunk"""
+        family2 = self.create_family(name_suffix="2")
+
+        with CaptureQueriesContext(connection) as queries:
+            records = list(load_family_records(Family.objects.order_by("pk"), chunk_size=1))
+
+        self.assertListEqual([record.pk for record in records], [self.family.pk, family2.pk])
+        self.assertListEqual(records[1].guest_names(), ["Françoise2", "Jean2"])
+        self.assertListEqual(records[1].accompany_names(), ["Michel2", "Michelle2"])
+        self.assertEqual(len(queries.captured_queries), 1 + 2 * 2)
+        family2.delete()
@@ -0,0 +1,27 @@
+"""
+test invite.render
+"""
+from unittest import TestCase
+
+from invite.lazy_context import LazyContext
+from invite.render import render_template
+
+
+class TestRenderTemplate(TestCase):
+    """
+    test invite.render render_template
+    """
+    def test_lazy_context(self):
+        """test the lazy context values are computed when used"""
+        context = LazyContext({"name": lambda context: "Marie"}, {})
+
+        self.assertEqual(render_template("Hello {{ name }}", context), "Hello Marie")
+
+    def test_assignment(self):
+        """test the "as variable" tags assign their variable over the lazy context"""
+        context = LazyContext({"name": lambda context: "Marie"}, {})
+
+        self.assertEqual(render_template(
+            '{% load i18n %}{% get_current_language as LANG %}{% cycle "a" "b" as letter %}'
+            '{{ LANG }} {{ letter }} {{ name }}', context
+        ), "aen-us a Marie")
@@ -0,0 +1,66 @@
+"""
+test invite.search
+"""
+from unittest import TestCase
+
+from invite.models import Accompany, FamilySearchToken, Guest
+from invite.search import tokenize, names_tokens, prefix_range
+from invite.tests.common import TestFamilyMixin
+
+
+class TestTokenize(TestCase):
+    """
+    test invite.search tokenize functions
+    """
+    def test_tokenize(self):
+        """test the tokens are lower case words without accents"""
+        self.assertListEqual(tokenize("Françoise & Jean-Pierre"), ["francoise", "jean", "pierre"])
+
+    def test_tokenize_empty(self):
+        """test tokenize without name"""
+        self.assertListEqual(tokenize(None), [])
+
+    def test_names_tokens(self):
+        """test names tokens are deduplicated"""
+        self.assertSetEqual(names_tokens(["Jean Dupont", "Marie Dupont"]),
+                            {"jean", "marie", "dupont"})
+
+    def test_prefix_range(self):
+        """test the prefix range contains the tokens starting with the term"""
+        lower, upper = prefix_range("jea")
+        self.assertTrue(lower <= "jean" < upper)
+        self.assertFalse(lower <= "jeb" < upper)
+
+
+class TestFamilySearchToken(TestFamilyMixin, TestCase):
+    """
+    test the families search tokens
+    """
+    def test_tokens(self):
+        """test the tokens are created with the guests and accompanies"""
+        self.assertSetEqual(set(self.family.search_tokens.values_list("token", flat=True)),
+                            {"francoise", "jean", "michel", "michelle"})
+
+    def test_tokens_update(self):
+        """test the tokens follow the guests and accompanies changes"""
+        guest = self.family.guests.get(name="Jean")
+        guest.name = "Pierre"
+        guest.save()
+        Accompany.objects.filter(family=self.family, name="Michel").delete()
+
+        self.assertSetEqual(set(self.family.search_tokens.values_list("token", flat=True)),
+                            {"francoise", "pierre", "michelle"})
+
+    def test_search(self):
+        """test the search match the beginning of the words of every terms"""
+        other_family = self.create_family(name_suffix=" Dupont")
+
+        self.assertSetEqual(set(FamilySearchToken.objects.search("Fran")
+                                .values_list("family_id", flat=True)),
+                            {self.family.pk, other_family.pk})
+        self.assertSetEqual(set(FamilySearchToken.objects.search("fran dup")
+                                .values_list("family_id", flat=True)),
+                            {other_family.pk})
+        self.assertIsNone(FamilySearchToken.objects.search(" "))
+        other_family.delete()
+        self.assertFalse(Guest.objects.filter(name__contains="Dupont").exists())
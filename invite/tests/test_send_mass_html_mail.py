@@ -3,13 +3,28 @@ test_send_mass_html_mail
 
 Created by lmarvaud on 03/11/2018
 """
-from unittest.mock import patch
+import asyncio
+from threading import current_thread
+from unittest.mock import patch, Mock
 
 import django.conf
 from django.core import mail
-from django.test import TestCase
+from django.core.mail import get_connection
+from django.test import TestCase, override_settings
 
-from invite.send_mass_html_mail import send_mass_html_mail
+from invite import send_mass_html_mail as send_mass_html_mail_module
+from invite.send_mass_html_mail import send_mass_html_mail, asend_mass_html_mail, \
+    run_asend_mass_html_mail
+from invite.tests.common import SMTPStandIn
+
+
+def run_async(coroutine):
+    """Run a coroutine in a new event loop until it is complete"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
 
 
 class TestSendMassHtmlMail(TestCase):
@@ -39,3 +54,176 @@ class TestSendMassHtmlMail(TestCase):
         ], reply_to=["reply_to@example.com"])
 
         self.assertEqual(mail.outbox[0].from_email, "valid@example.com")
+
+    def test_build_once(self):
+        """Test each message is built once, when the SMTP backend sends it"""
+        for senders in (0, 2):
+            with patch("django.core.mail.backends.smtp.smtplib.SMTP") as smtp, \
+                    patch.object(send_mass_html_mail_module, "_create_message",
+                                 wraps=send_mass_html_mail_module._create_message  # pylint: disable=protected-access
+                                 ) as create_message:
+                result = send_mass_html_mail([
+                    ("subject%d" % i, "text", "html", "from@example.com",
+                     ["recipient%d@example.com" % i])
+                    for i in range(3)
+                ], connection=get_connection("django.core.mail.backends.smtp.EmailBackend"),
+                                             senders=senders)
+
+            self.assertEqual(result, 3)
+            self.assertEqual(create_message.call_count, 3)
+            self.assertListEqual(sorted(call[0][1] for call in smtp().sendmail.call_args_list),
+                                 [["recipient%d@example.com" % i] for i in range(3)])
+
+    def test_streaming(self):
+        """Test send_mass_html_mail send each message while the datatuple is generated"""
+        events = []
+        connection = Mock(send_messages=Mock(
+            side_effect=lambda messages: events.append(("send", messages[0].subject)) or 1
+        ))
+
+        def datatuple():
+            """Generate the datatuple and log the generation"""
+            for i in range(3):
+                events.append(("render", "subject%d" % i))
+                yield ("subject%d" % i, "text", "html", None, ["recipient@example.com"])
+
+        self.assertEqual(send_mass_html_mail(datatuple(), connection=connection), 3)
+        self.assertListEqual(events, [(event, "subject%d" % i) for i in range(3)
+                                      for event in ("render", "send")])
+        connection.close.assert_called_once_with()
+
+    def test_senders(self):
+        """Test send_mass_html_mail send with many threads"""
+        result = send_mass_html_mail((
+            ("subject%d" % i, "text%d" % i, "html%d" % i, "from_email%d@example.com" % i,
+             ["recipient%d@example.com" % i])
+            for i in range(5)
+        ), senders=2, reply_to=["reply_to@example.com"])
+
+        self.assertEqual(result, 5)
+        outbox = sorted(mail.outbox, key=lambda message: message.subject)
+        self.assertListEqual([message.subject for message in outbox],
+                             ["subject%d" % i for i in range(5)])
+        self.assertListEqual(outbox[0].reply_to, ["reply_to@example.com"])
+
+    def test_senders_overlap(self):
+        """Test send_mass_html_mail send while the datatuple is generated"""
+        events = []
+        connection = Mock(send_messages=Mock(
+            side_effect=lambda messages: events.append(("send", messages[0].subject)) or 1
+        ))
+
+        def datatuple():
+            """Generate the datatuple and log the generation"""
+            for i in range(5):
+                events.append(("render", "subject%d" % i))
+                yield ("subject%d" % i, "text", "html", None, ["recipient@example.com"])
+
+        result = send_mass_html_mail(datatuple(), connection=connection, senders=1, queue_size=1)
+
+        self.assertEqual(result, 5)
+        self.assertLess(events.index(("send", "subject0")), events.index(("render", "subject3")))
+
+    def test_senders_recipients_thread(self):
+        """Test the lazy recipients are read by the datatuple thread, not the sending ones"""
+        threads = []
+
+        def recipients():
+            """Generate the recipients, logging the reading thread"""
+            threads.append(current_thread())
+            yield "recipient@example.com"
+
+        send_mass_html_mail([("subject", "text", "html", None, recipients())], senders=1)
+        run_async(asend_mass_html_mail([("subject", "text", "html", None, recipients())]))
+
+        self.assertListEqual(threads, [current_thread()] * 2)
+        self.assertListEqual(mail.outbox[1].to, ["recipient@example.com"])
+
+    def test_senders_error(self):
+        """Test send_mass_html_mail raise the sending thread errors"""
+        connection = Mock(send_messages=Mock(side_effect=OSError("Connection refused")))
+
+        with self.assertRaises(OSError):
+            send_mass_html_mail([
+                ("subject%d" % i, "text", "html", None, ["recipient@example.com"])
+                for i in range(10)
+            ], connection=connection, senders=1, queue_size=1)
+        self.assertEqual(connection.send_messages.call_count, 1)
+        connection.close.assert_called_once_with()
+
+
+class AsyncDatatuple:  # pylint: disable=too-few-public-methods
+    """Asynchronous iterator of datatuples"""
+    def __init__(self, datatuple):
+        self.datatuple = iter(datatuple)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.datatuple)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class TestAsendMassHtmlMail(TestCase):
+    """Test asend_mass_html_mail"""
+    def test(self):
+        """Test asend_mass_html_mail with an asynchronous iterator over many SMTP sessions"""
+        with SMTPStandIn() as server, override_settings(
+                EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+                EMAIL_HOST="127.0.0.1", EMAIL_PORT=server.port):
+            result = run_async(asend_mass_html_mail(AsyncDatatuple(
+                ("subject%d" % i, "text%d" % i, "html%d" % i, "from_email%d@example.com" % i,
+                 ["recipient%d@example.com" % i])
+                for i in range(5)
+            ), sessions=2, reply_to=["reply_to@example.com"]))
+
+        self.assertEqual(result, 5)
+        received = sorted(server.messages, key=lambda message: message[2]["Subject"])
+        self.assertEqual(len(received), 5)
+        for i, (mail_from, rcpt_tos, message) in enumerate(received):
+            self.assertEqual(mail_from, "from_email%d@example.com" % i)
+            self.assertListEqual(rcpt_tos, ["recipient%d@example.com" % i])
+            self.assertEqual(message["Subject"], "subject%d" % i)
+            self.assertEqual(message["Reply-To"], "reply_to@example.com")
+            self.assertListEqual([part.get_payload() for part in message.get_payload()],
+                                 ["text%d" % i, "html%d" % i])
+
+    def test_iterable(self):
+        """Test run_asend_mass_html_mail with a synchronous iterable"""
+        result = run_asend_mass_html_mail([
+            ("subject", "text", "html", None, ["recipient@example.com"])
+        ])
+
+        self.assertEqual(result, 1)
+        self.assertEqual(mail.outbox[0].subject, "subject")
+
+    def test_error(self):
+        """Test asend_mass_html_mail raise the sending errors"""
+        connection = Mock(send_messages=Mock(side_effect=OSError("Connection refused")))
+
+        with self.assertRaises(OSError):
+            run_async(asend_mass_html_mail([
+                ("subject%d" % i, "text", "html", None, ["recipient@example.com"])
+                for i in range(10)
+            ], connection=connection))
+        self.assertEqual(connection.send_messages.call_count, 1)
+        connection.close.assert_called_once_with()
+
+    def test_datatuple_error(self):
+        """Test the queued messages are sent and the sessions closed when the datatuple raises"""
+        connection = Mock(send_messages=Mock(return_value=1))
+
+        def datatuple():
+            """Generate two datatuples, then fail"""
+            for i in range(2):
+                yield ("subject%d" % i, "text", "html", None, ["recipient@example.com"])
+            raise ValueError("Render error")
+
+        with self.assertRaises(ValueError):
+            run_async(asend_mass_html_mail(AsyncDatatuple(datatuple()),
+                                                connection=connection))
+        self.assertEqual(connection.send_messages.call_count, 2)
+        connection.close.assert_called_once_with()
@@ -0,0 +1,118 @@
+"""
+test invite.spool
+"""
+import os
+from smtplib import SMTPRecipientsRefused
+from tempfile import TemporaryDirectory
+from unittest.mock import Mock, patch
+
+from django.core import mail
+from django.test import TestCase
+
+from invite import spool
+from invite.spool import flush_spool, requeue, spool_mass_html_mail, SpooledMessage
+
+
+class TestSpool(TestCase):
+    """
+    test invite.spool functions
+    """
+    def setUp(self):
+        self.spool = TemporaryDirectory()
+        self.spool_dir = self.spool.name
+
+    def tearDown(self):
+        self.spool.cleanup()
+
+    def listdir(self, name):
+        """List the files of a spool sub directory"""
+        return sorted(os.listdir(os.path.join(self.spool_dir, name)))
+
+    def spool_messages(self, number=3):
+        """Spool some messages"""
+        return spool_mass_html_mail([
+            ("subject%d" % i, "text%d" % i, "html%d" % i, "Marie <from@example.com>",
+             ["Françoise <recipient%d@example.com>" % i])
+            for i in range(number)
+        ] + [("subject", "text", "html", None, [])], self.spool_dir,
+                                    reply_to=["reply_to@example.com"])
+
+    def test_spool(self):
+        """test the complete messages are written to the new directory, without recipients ones"""
+        self.assertEqual(self.spool_messages(), 3)
+
+        self.assertListEqual(self.listdir("tmp"), [])
+        names = self.listdir("new")
+        self.assertEqual(len(names), 3)
+        message = SpooledMessage(os.path.join(self.spool_dir, "new", names[0]))
+        self.assertEqual(message.from_email, "from@example.com")
+        self.assertListEqual(message.recipients(), ["recipient0@example.com"])
+        data = message.message().as_bytes(linesep="\r\n")
+        self.assertIn(b"Subject: subject0\r\n", data)
+        self.assertIn(b"Reply-To: reply_to@example.com\r\n", data)
+        self.assertNotIn(b"X-Invite-Envelope", data)
+
+    def test_flush(self):
+        """test the messages are sent in their spooling order, and moved to sent"""
+        self.spool_messages()
+
+        self.assertTupleEqual(flush_spool(self.spool_dir), (3, 0))
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn(b"Subject: subject2", mail.outbox[2].message().as_bytes())
+        self.assertListEqual(self.listdir("new"), [])
+        self.assertEqual(len(self.listdir("sent")), 3)
+        self.assertTupleEqual(flush_spool(self.spool_dir), (0, 0))
+
+    def test_flush_failed(self):
+        """test the refused messages are moved to failed, and can be requeued"""
+        self.spool_messages(2)
+        connection = Mock(send_messages=Mock(side_effect=[
+            SMTPRecipientsRefused({"recipient0@example.com": (550, b"Unknown")}), 1
+        ]))
+
+        with self.assertLogs(level="WARNING"):
+            self.assertTupleEqual(flush_spool(self.spool_dir, connection=connection), (1, 1))
+
+        self.assertEqual(len(self.listdir("sent")), 1)
+        self.assertEqual(len(self.listdir("failed")), 1)
+        connection.close.assert_called_once_with()
+        self.assertEqual(requeue(self.spool_dir), 1)
+        self.assertTupleEqual(flush_spool(self.spool_dir), (1, 0))
+        self.assertListEqual(mail.outbox[0].recipients(), ["recipient0@example.com"])
+
+    def test_flush_claimed(self):
+        """test the messages claimed by a concurrent flush are skipped"""
+        self.spool_messages(2)
+        names = self.listdir("new")
+        os.rename(os.path.join(self.spool_dir, "new", names[0]),
+                  os.path.join(self.spool_dir, "cur", names[0]))
+
+        with patch.object(spool.os, "listdir", return_value=names):
+            self.assertTupleEqual(flush_spool(self.spool_dir), (1, 0))
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertListEqual(self.listdir("cur"), names[:1])
+        self.assertListEqual(self.listdir("sent"), names[1:])
+
+    def test_requeue_interrupted(self):
+        """test the messages left claimed by an interrupted flush are sent once requeued"""
+        self.spool_messages(1)
+        connection = Mock(send_messages=Mock(side_effect=KeyboardInterrupt))
+
+        with self.assertRaises(KeyboardInterrupt):
+            flush_spool(self.spool_dir, connection=connection)
+
+        self.assertEqual(len(self.listdir("cur")), 1)
+        self.assertEqual(requeue(self.spool_dir, spool.CUR), 1)
+        self.assertTupleEqual(flush_spool(self.spool_dir), (1, 0))
+
+    def test_flush_connection_error(self):
+        """test the messages stay in the spool when the mail server is unreachable"""
+        self.spool_messages(2)
+        connection = Mock(open=Mock(side_effect=OSError("Connection refused")))
+
+        with self.assertRaises(OSError):
+            flush_spool(self.spool_dir, connection=connection)
+
+        self.assertEqual(len(self.listdir("new")), 2)
@@ -8,6 +8,7 @@ from django.test import TestCase
 
 from django.urls import reverse
 
+from invite.models import Family
 from invite.tests.common import TestEventMixin, TestMailTemplateMixin, MockRequest
 from invite.views import show_mail_txt, show_mail_html
 
@@ -20,6 +21,14 @@ class TestShowMailTxt(TestMailTemplateMixin, TestEventMixin, TestCase):  # pylin
 
         self.assertEqual(result.content.decode("utf-8"), self.expected_text)
 
+    def test_show_mail_txt_language(self):
+        """test the mail is rendered in the family language"""
+        Family.objects.filter(pk=self.family.pk).update(language="fr")
+
+        result = show_mail_txt(MockRequest.instance(), self.event.pk, self.family.pk)
+
+        self.assertIn("Françoise et Jean", result.content.decode("utf-8"))
+
     def test_url_unlogged(self):
         """Test url acces to show the email, with unlogged user"""
         result = self.client.get('/invite/show_mail/event/%d/family/%d.txt' % (self.family.pk,